@@ -1 +1,7 @@
-from schmuxi.spec_evaluation import Experiment
+def __getattr__(name):
+    '''imports Experiment only when it is used, importing the package itself
+    stays cheap'''
+    if name == "Experiment":
+        from schmuxi.spec_evaluation import Experiment
+        return(Experiment)
+    raise AttributeError("module 'schmuxi' has no attribute " + repr(name))
@@ -2,74 +2,136 @@ import re
 import yaml
 from os import chdir
 from glob import glob
+from functools import lru_cache
 
 config_source = "spec_config.yml"
 
 def open_config(config):
     with open(config, 'r') as configfile:
-        cfg = yaml.load(configfile)
+        cfg = yaml.safe_load(configfile)
     return(cfg)
 
+#The parameters are found in the filename by a single scan with one compiled pattern.
+#Every number is read together with its prefix and unit, e.g.
+#   120s -> exposure, 530nm -> excitation, bw10nm or +-5nm -> bandwidth, 4K -> temperature,
+#   50uW -> power, 78MHz -> repetition, x41329y08629 -> position (xm.../ym... are negative)
+#A position is only read from x<number> directly followed by y<number>, other numbers
+#after an x (e.g. 3x10s accumulations) are classified by their unit.
+#Only the first occurrence of every parameter counts. Parameters, that are not in the
+#filename, are read from the configfile.
+
+token = re.compile(r"(?<![a-z])x(?P<x_sign>m?)(?P<x>[0-9]+)y(?P<y_sign>m?)(?P<y>[0-9]+)"
+                   r"|(?P<prefix>bw|\+-|-\+)?"
+                   r"(?P<number>[0-9]+)"
+                   r"(?P<unit>[a-z]hz|nm|[a-z]?w|s|k)?",
+                   re.IGNORECASE)
+
+units = {"s": "exposure", "nm": "excitation", "k": "temperature"}
+
+defaults = {"exposure": ("spec_paras", "exposure"),
+            "excitation": ("general", "excitation"),
+            "bandwidth": ("general", "bandwidth"),
+            "temperature": ("general", "temperature"),
+            "power": ("general", "power"),
+            "repetition": ("general", "repetition"),
+            "x": (None, None),
+            "y": (None, None)}
+
+parameter_names = list(defaults)
+
+
+@lru_cache(maxsize=65536)
+def scan(spec):
+    """returns the parameters found in the filename (memoised per name)"""
+    found = {}
+    spread = None
+    for match in token.finditer(spec):
+        if match.group("x") is not None:
+            if "x" not in found:
+                for axis in ("x", "y"):
+                    value = float(match.group(axis))
+                    found[axis] = -value if match.group(axis + "_sign") else value
+            continue
+        prefix = (match.group("prefix") or "").lower()
+        unit = (match.group("unit") or "").lower()
+        value = float(match.group("number"))
+        if unit == "nm" and prefix == "bw":
+            found.setdefault("bandwidth", value)
+        elif unit == "nm" and prefix in ("+-", "-+"):
+            spread = value*2 if spread is None else spread
+        elif unit in units:
+            found.setdefault(units[unit], value)
+        elif unit.endswith("hz"):
+            found.setdefault("repetition", value)
+        elif unit.endswith("w"):
+            found.setdefault("power", value)
+    if spread is not None:
+        found.setdefault("bandwidth", spread)
+    return(found)
+
+
+def default(name, cfg):
+    section, key = defaults[name]
+    if section is None:
+        return None
+    return cfg[section][key]
+
 #The following methods find parameters in the filename or reads it from the configfile
 
 def find_exposure(spec, cfg):
-    if re.match(".*[0-9]+[sS].*", spec):
-        print(re.search("[0-9]+[sS]",spec).group()[:-1])
-        return float(re.search("[0-9]+[sS]",spec).group()[:-1])
-    else:
-        return cfg["spec_paras"]["exposure"]
+    return scan(spec).get("exposure", default("exposure", cfg))
 
 def find_excitation(spec, cfg):
-    if re.match(".*[0-9]+nm.*", spec, re.IGNORECASE):
-        return float(re.search("[0-9]+nm", spec, re.IGNORECASE).group()[:-2])
-    else:
-        return cfg["general"]["excitation"]
+    return scan(spec).get("excitation", default("excitation", cfg))
 
 def find_bandwidth(spec, cfg):
-    if re.match(".*bw[0-9]+nm.*", spec, re.IGNORECASE):
-        return float((re.search("(bw|BW)[0-9]+nm", spec, re.IGNORECASE).group()[:-2])[2:]) 
-    elif re.match(".*(\+-|-\+)[0-9]+nm.*", spec, re.IGNORECASE):
-        return float((re.search("(\+-|-\+)[0-9]+nm", spec, re.IGNORECASE).group()[:-2])[2:])*2
-    else:
-        return cfg["general"]["bandwidth"]
+    return scan(spec).get("bandwidth", default("bandwidth", cfg))
 
 def find_temperature(spec, cfg):
-    if re.match(".*[0-9]+(K|k).*", spec):
-        return float(re.search("[0-9]+(k|K)",spec).group()[:-1])
-    else:
-        return cfg["general"]["temperature"]
+    return scan(spec).get("temperature", default("temperature", cfg))
 
 def check_if_map(spec, cfg):
     return re.match(".*(DCmap).*", spec, re.IGNORECASE)
 
 def find_power(spec, cfg): #returns only the numerical value, NOT the unit
-    if re.match(".*[0-9]+[a-z]?W.*", spec, re.IGNORECASE):
-        power_word = re.search("[0-9]+[a-z]?W", spec, re.IGNORECASE).group()
-        return float(re.search("[0-9]*",power_word).group())
-    else:
-        return cfg["general"]["power"]
+    return scan(spec).get("power", default("power", cfg))
 
 def find_repetition(spec, cfg): #returns only the numerical value, NOT the unit
-    if re.match(".*[0-9]+[a-z]hz.*", spec, re.IGNORECASE):
-       repetition_word = re.search("[0-9]+[a-z]?hz", spec, re.IGNORECASE).group()
-       return float(re.search("[0-9]*",repetition_word).group())
-    else:
-        return cfg["general"]["repetition"]
+    return scan(spec).get("repetition", default("repetition", cfg))
+
+def find_position(spec, cfg): #(x, y) of the stage, None if not in the filename
+    found = scan(spec)
+    return (found.get("x"), found.get("y"))
 
 #work in progress
 #def find_material(spec, cfg):
     #if re.match(".
 
 def find_parameters(spec, cfg):
-    parameters = {}
-    parameters["exposure"] = find_exposure(spec, cfg)
-    parameters["excitation"] = find_excitation(spec, cfg)
-    parameters["bandwidth"] = find_bandwidth(spec, cfg)
-    parameters["temperature"] = find_temperature(spec, cfg)
-    #parameters["map"] = check_if_map(spec, cfg)
-    parameters["power"] = find_power(spec, cfg)
-    parameters["repetition"] = find_repetition(spec, cfg)
-    return parameters
+    found = scan(spec)
+    parameters = {name: found.get(name, default(name, cfg))
+                  for name in parameter_names}
+    return(parameters)
+
+def parameter_table(specs, cfg):
+    """parameters of many files as a columnar table (pandas.DataFrame) with
+    one row per file"""
+    import pandas as pd
+    specs = list(specs)
+    found = [scan(spec) for spec in specs]
+    columns = {}
+    for name in parameter_names:
+        fallback = default(name, cfg)
+        columns[name] = [entry.get(name, fallback) for entry in found]
+    return(pd.DataFrame(columns, index=specs, columns=parameter_names))
+
+def directory_parameters(directory, cfg, pattern='*.txt'):
+    """parameter table of all (plain or compressed) files in a directory"""
+    import os
+    from compressed import patterns
+    specs = sorted(os.path.basename(entry) for a_pattern in patterns(pattern)
+                   for entry in glob(os.path.join(directory, a_pattern)))
+    return(parameter_table(specs, cfg))
 
 def main():
     cfg = open_config(config_source)
@@ -0,0 +1,95 @@
+'''Shared cache of calibration axes.
+
+Spectra taken with the same grating setting share an identical wavelength
+axis. The registry interns identical axes, so that their energy form, the
+sort order of the energies and the Jacobian for the intensity conversion are
+only calculated once and then reused by Experiment, the map viewer and the
+sweep viewer.'''
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+hc = 1239.82 #eV*nm
+max_axes = 256
+
+
+class Axis:
+    '''A wavelength axis [nm] with its cached energy form [eV]'''
+
+    def __init__(self, wavelength):
+        self.wavelength = np.array(wavelength, dtype=float)
+        self.wavelength.setflags(write=False)
+        self._energy = None
+        self._order = None
+        self._jacobian = None
+
+
+    @property
+    def energy(self):
+        '''energies in the order of the wavelengths'''
+        if self._energy is None:
+            self._energy = hc/self.wavelength
+            self._energy.setflags(write=False)
+        return(self._energy)
+
+
+    @property
+    def order(self):
+        '''permutation, that sorts the energies ascending'''
+        if self._order is None:
+            self._order = np.argsort(self.energy, kind='stable')
+            self._order.setflags(write=False)
+        return(self._order)
+
+
+    @property
+    def sorted_energy(self):
+        '''energies sorted ascending'''
+        return(self.energy[self.order])
+
+
+    @property
+    def jacobian(self):
+        '''factor converting intensities per wavelength into intensities per
+        energy (lambda^2/hc), in the order of the wavelengths'''
+        if self._jacobian is None:
+            self._jacobian = self.wavelength**2/hc
+            self._jacobian.setflags(write=False)
+        return(self._jacobian)
+
+
+class AxisRegistry:
+    '''Interns identical axes. The least recently used axes are dropped, when
+    more than max_axes are registered.'''
+
+    def __init__(self, max_axes=max_axes):
+        self.max_axes = max_axes
+        self.axes = OrderedDict()
+
+
+    def key(self, wavelength):
+        '''identifier of an axis by its content'''
+        wavelength = np.ascontiguousarray(wavelength, dtype=float)
+        return((wavelength.size, hashlib.sha1(wavelength.tobytes()).digest()))
+
+
+    def intern(self, wavelength):
+        '''returns the registered Axis with the given wavelengths'''
+        key = self.key(wavelength)
+        axis = self.axes.get(key)
+        if axis is None:
+            axis = Axis(wavelength)
+            self.axes[key] = axis
+            if len(self.axes) > self.max_axes:
+                self.axes.popitem(last=False)
+        else:
+            self.axes.move_to_end(key)
+        return(axis)
+
+
+registry = AxisRegistry()
+
+
+def intern_axis(wavelength):
+    '''returns the shared Axis for the given wavelengths'''
+    return(registry.intern(wavelength))
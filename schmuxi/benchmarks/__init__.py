@@ -0,0 +1,5 @@
+'''Benchmarks for the hot paths of schmuxi. Run them from the schmuxi
+directory, e.g.
+
+python -m benchmarks.bench_parser
+'''
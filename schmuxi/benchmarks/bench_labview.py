@@ -0,0 +1,118 @@
+'''Compares the chunked streaming parser of LabVIEW text maps with the former
+np.loadtxt path of load_labview_map. Every loader runs in a fresh interpreter,
+so that its peak resident memory (VmHWM, ru_maxrss where /proc is missing)
+can be reported next to the throughput in MB of text per second. The memory
+map of stream_cube counts as resident as far as it was written.'''
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from benchmarks import synthetic
+
+schmuxi_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+loaders = {
+    "loadtxt": '''
+from map_io import read_text
+def load(path, dimensions, background=0):
+    data = read_text(path)[6:]
+    data3d = np.stack(np.vsplit(np.transpose(data)[1:], dimensions)) - background
+    return(data3d, data[:,0])
+''',
+    "stream": '''
+from map_io import stream_labview_map
+def load(path, dimensions):
+    return(stream_labview_map(path, dimensions))
+''',
+    "stream_cube": '''
+import shutil
+from map_cube import labview_cube
+def load(path, dimensions):
+    directory = os.path.join(os.path.dirname(path), "bench_cubes")
+    shutil.rmtree(directory, ignore_errors=True)
+    cube = labview_cube(path, dimensions, directory=directory)
+    return(cube.cube, cube.calibration)
+'''}
+
+probe = '''
+import os, sys, time, resource
+import numpy as np
+%s
+def peak_rss():
+    # VmHWM starts anew with the interpreter, ru_maxrss may be inherited
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return(int(line.split()[1]))
+    except IOError:
+        pass
+    return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+path, dimensions, repeat = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+baseline = peak_rss()
+times = []
+for i in range(repeat):
+    start = time.perf_counter()
+    cube, calibration = load(path, dimensions)
+    times.append(time.perf_counter() - start)
+    checksum = float(np.sum(cube[:, :, ::97], dtype=float))
+    del cube, calibration
+peak = peak_rss()
+print("%%f;%%d;%%d;%%f" %% (min(times), baseline, peak, checksum))
+'''
+
+
+def measure(loader, path, dimensions, repeat):
+    '''best time, resident memory before and at the peak (kB) and a checksum
+    of the cube, measured in a fresh interpreter'''
+    output = subprocess.run([sys.executable, "-c", probe % loaders[loader],
+                             path, str(dimensions), str(repeat)],
+                            cwd=schmuxi_dir,
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True).stdout.strip().split("\n")[-1]
+    elapsed, baseline, peak, checksum = output.split(";")
+    return(float(elapsed), int(baseline), int(peak), float(checksum))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dimensions", type=int, default=60)
+    parser.add_argument("--channels", type=int, default=1340)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compressed", action="store_true",
+                        help="also measure a gzipped copy of the map")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cube, calibration = synthetic.map_cube(arguments.dimensions,
+                                               arguments.channels)
+        paths = [os.path.join(directory, "map.txt")]
+        synthetic.write_labview_map(paths[0], cube, calibration)
+        del cube
+        if arguments.compressed:
+            paths += [os.path.join(directory, name) for name in
+                      synthetic.compress(directory, ["map.txt"], directory)]
+        size = os.path.getsize(paths[0])/1024**2
+        print("map of %dx%d pixels and %d channels, %.1f MB of text"
+              % (arguments.dimensions, arguments.dimensions,
+                 arguments.channels, size))
+        for path in paths:
+            checksums = set()
+            for loader in loaders:
+                elapsed, baseline, peak, checksum = measure(loader,
+                                                            path,
+                                                            arguments.dimensions,
+                                                            arguments.repeat)
+                checksums.add(round(checksum, 3))
+                print("%-14s %-12s %7.2f s %8.1f MB/s   peak RSS %7.1f MB"
+                      " (+%.1f MB)" % (os.path.basename(path), loader,
+                                       elapsed, size/elapsed, peak/1024,
+                                       (peak - baseline)/1024))
+            if len(checksums) > 1:
+                print("the loaders disagree:", sorted(checksums))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''Compares the dedicated two-column parser with the former pandas.read_csv
+path of Experiment.load_file on synthetic spectra.'''
+import os
+import time
+import argparse
+import tempfile
+import pandas as pd
+from pretreatment import replace_garbage
+from spectrum_parser import parse_spectrum
+from benchmarks.synthetic import write_spectra
+
+
+def best_of(function, files, repeat):
+    '''best total time of parsing all files'''
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for a_file in files:
+            function(a_file)
+        times.append(time.perf_counter() - start)
+    return(min(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--pixels", type=int, default=1340)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory += os.sep
+        raw_dir = directory + "raw" + os.sep
+        clean_dir = directory + "clean" + os.sep
+        os.makedirs(raw_dir)
+        os.makedirs(clean_dir)
+        names = write_spectra(raw_dir, arguments.files, arguments.pixels, True)
+        clean_files = [clean_dir + name for name in names]
+        raw_files = [raw_dir + name for name in names]
+
+        start = time.perf_counter()
+        replace_garbage(raw_dir, clean_dir, names)
+        cleaning = time.perf_counter() - start
+
+        pandas_time = best_of(
+                lambda a_file: pd.read_csv(a_file, sep=" ", header=None),
+                clean_files,
+                arguments.repeat)
+        clean_time = best_of(parse_spectrum, clean_files, arguments.repeat)
+        raw_time = best_of(parse_spectrum, raw_files, arguments.repeat)
+
+    print("%d files x %d pixels" % (arguments.files, arguments.pixels))
+    print("replace_garbage + pandas.read_csv: %8.3f s"
+          % (cleaning + pandas_time))
+    print("pandas.read_csv (cleaned files):   %8.3f s" % pandas_time)
+    print("parse_spectrum (cleaned files):    %8.3f s" % clean_time)
+    print("parse_spectrum (raw files):        %8.3f s" % raw_time)
+
+
+if __name__ == '__main__':
+    main()
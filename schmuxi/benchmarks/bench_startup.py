@@ -0,0 +1,59 @@
+'''Measures the cold start of the command line interface, of importing
+spec_evaluation and of a real command (params on the test spectra, which
+reads the configuration), each in a fresh interpreter, and reports which
+heavy modules got imported on the way.'''
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+schmuxi_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+heavy_modules = ["pandas", "matplotlib.pyplot", "scipy", "bokeh", "yaml"]
+
+probe = '''
+import sys, time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print("%%f;%%s" %% (elapsed, ",".join(m for m in %r if m in sys.modules)))
+'''
+
+targets = {"import cli": "import cli",
+           "import autofind_paras": "import autofind_paras",
+           "import spec_evaluation": "import spec_evaluation",
+           "schmuxi --help": "import cli\ntry:\n    cli.main(['--help'])\n"
+                             "except SystemExit:\n    pass",
+           # a real command: reads the configuration and scans the names
+           "schmuxi params": "import cli, glob\n"
+                             "cli.main(['params']"
+                             " + sorted(glob.glob('test-spectra/*.txt')))"}
+
+
+def measure(statement, repeat):
+    '''best time of running the statement in a fresh interpreter'''
+    times = []
+    for i in range(repeat):
+        output = subprocess.run(
+                    [sys.executable, "-c", probe % (statement, heavy_modules)],
+                    cwd=schmuxi_dir,
+                    stdout=subprocess.PIPE,
+                    universal_newlines=True,
+                    check=True).stdout.strip().split("\n")[-1]
+        elapsed, modules = output.split(";")
+        times.append(float(elapsed))
+    return(min(times), modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+    for name, statement in targets.items():
+        elapsed, modules = measure(statement, arguments.repeat)
+        print("%-24s %7.1f ms   heavy modules: %s"
+              % (name, 1000*elapsed, modules or "-"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+'''Times and memory-profiles the hot paths of schmuxi on synthetic data.
+
+python -m benchmarks.run --scale small --output results.json
+python -m benchmarks.run --scale small --compare baseline.json
+
+Every stage is timed (best of --repeat runs) and its peak of allocated
+memory is measured with tracemalloc in a separate run. Compared against a
+baseline, stages that got slower or need more memory than the tolerance
+allows are reported as regressions and the exit code is 1.'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+
+from benchmarks import synthetic
+
+scales = {"tiny": {"spectra": 50, "pixels": 1340, "dimensions": 10,
+                   "channels": 1340, "sweep_rows": 50},
+          "small": {"spectra": 1000, "pixels": 1340, "dimensions": 40,
+                    "channels": 1340, "sweep_rows": 100},
+          "large": {"spectra": 10000, "pixels": 1340, "dimensions": 200,
+                    "channels": 1340, "sweep_rows": 500}}
+
+
+def quiet(function):
+    '''suppresses the chatter of the measured functions'''
+    def wrapper(*arguments):
+        stdout = sys.stdout
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                return(function(*arguments))
+            finally:
+                sys.stdout = stdout
+    return(wrapper)
+
+
+def measure(function, repeat):
+    '''best wall time of repeat runs and the peak of allocated memory'''
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return({"seconds": min(times), "peak_mb": peak/1024**2})
+
+
+def prepare(directory, scale):
+    '''writes all synthetic inputs and returns their paths'''
+    inputs = dict()
+    for folder in ["raw", "clean", "target", "raw_gz", "clean_gz"]:
+        os.makedirs(os.path.join(directory, folder))
+        inputs[folder + "_dir"] = os.path.join(directory, folder) + os.sep
+    inputs["raw"] = synthetic.write_spectra(inputs["raw_dir"],
+                                            scale["spectra"],
+                                            scale["pixels"],
+                                            raw=True)
+    inputs["clean"] = synthetic.write_spectra(inputs["clean_dir"],
+                                              scale["spectra"],
+                                              scale["pixels"])
+    inputs["raw_gz"] = synthetic.compress(inputs["raw_dir"],
+                                          inputs["raw"],
+                                          inputs["raw_gz_dir"])
+    inputs["clean_gz"] = synthetic.compress(inputs["clean_dir"],
+                                            inputs["clean"],
+                                            inputs["clean_gz_dir"])
+
+    cube, calibration = synthetic.map_cube(scale["dimensions"],
+                                           scale["channels"])
+    inputs["dimensions"] = scale["dimensions"]
+    inputs["labview_map"] = os.path.join(directory, "map.txt")
+    synthetic.write_labview_map(inputs["labview_map"], cube, calibration)
+    inputs["labview_map_gz"] = os.path.join(
+                    directory,
+                    synthetic.compress(directory, ["map.txt"], directory)[0])
+    inputs["mat_map"] = os.path.join(directory, "map.tsv.mat")
+    inputs["mat_calibration"] = os.path.join(directory, "map.wlen_to_px.tsv.gz")
+    synthetic.write_mat_map(inputs["mat_map"],
+                            cube,
+                            inputs["mat_calibration"],
+                            calibration)
+    inputs["sweep"] = [os.path.join(directory, name) for name in
+                       synthetic.write_sweep(directory,
+                                             scale["sweep_rows"],
+                                             scale["channels"])]
+    inputs["sweep_txt"] = [os.path.join(directory, name) for name in
+                           synthetic.write_sweep(directory,
+                                                 scale["sweep_rows"],
+                                                 scale["channels"],
+                                                 compressed=False)]
+    return(inputs)
+
+
+def stages(inputs):
+    '''returns the measured stages as name -> function'''
+    from spec_evaluation import Experiment
+    from pretreatment import replace_garbage
+    from cosmics import erase_cosmics
+    from map_io import load_labview_map, load_mat_map, load_sweep
+    from image_tools import integrated_image, sweep_contrast
+    from image_tools import sweep_differential, ReferenceCache
+    from map_cube import labview_cube, channel_band
+    from map_fitting import fit_map
+    from map_decomposition import pca, nmf
+
+    Session = Experiment(auto_config=False,
+                         source=inputs["clean_dir"],
+                         working_dir=inputs["clean_dir"])
+    files = [inputs["clean_dir"] + name for name in inputs["clean"]]
+    files_gz = [inputs["clean_gz_dir"] + name for name in inputs["clean_gz"]]
+    spectra = [Session.load_file(a_file) for a_file in files]
+    stack = np.vstack([spectrum.values[:, 1] for spectrum in spectra])
+    cube = load_labview_map(inputs["labview_map"], inputs["dimensions"])[0]
+    sweep = load_sweep(*inputs["sweep"])[0]
+    cube_dir = os.path.join(os.path.dirname(inputs["labview_map"]), "cubes")
+    map_cube = labview_cube(inputs["labview_map"], inputs["dimensions"],
+                            directory=cube_dir)
+    map_cube.prefix_index()
+
+    def convert_cube():
+        shutil.rmtree(cube_dir + "_convert", ignore_errors=True)
+        return(labview_cube(inputs["labview_map"], inputs["dimensions"],
+                            directory=cube_dir + "_convert"))
+    energy = synthetic.hc/map_cube.calibration
+    exciton = channel_band(energy, 1.96, 2.06)
+
+    def fit_pixels():
+        for entry in os.listdir(map_cube.directory):
+            if entry.startswith("fit-"):
+                shutil.rmtree(os.path.join(map_cube.directory, entry))
+        return(fit_map(map_cube, energy, "lorentz", 1, exciton))
+
+    def differential_cube():
+        # builds the cube and its prefix index every time, not a cache hit
+        map_cube.differentials.clear()
+        for entry in os.listdir(map_cube.directory):
+            if entry.startswith("differential-"):
+                shutil.rmtree(os.path.join(map_cube.directory, entry))
+        return(map_cube.differential(map_cube.spectrum(0, 0)).band_image())
+    background = np.tile(sweep[0], (len(sweep), 1))
+    differential = ReferenceCache(sweep_differential)
+
+    return({
+        "replace_garbage": lambda: replace_garbage(inputs["raw_dir"],
+                                                   inputs["target_dir"],
+                                                   inputs["raw"]),
+        "replace_garbage_gz": lambda: replace_garbage(inputs["raw_gz_dir"],
+                                                      inputs["target_dir"],
+                                                      inputs["raw_gz"]),
+        "load_file": lambda: [Session.load_file(a_file) for a_file in files],
+        "load_file_gz": lambda: [Session.load_file(a_file)
+                                 for a_file in files_gz],
+        "adjust_spectrum": lambda: [Session.adjust_spectrum(spectrum.copy(),
+                                                            name)
+                                    for spectrum, name
+                                    in zip(spectra, inputs["clean"])],
+        "cosmic_erase": lambda: [Session.cosmic_erase(spectrum.copy(),
+                                                      Session.cosmic_cycles,
+                                                      Session.cosmic_distance,
+                                                      Session.cosmic_factor)
+                                 for spectrum in spectra],
+        "cosmic_erase_stack": lambda: erase_cosmics(stack,
+                                                    Session.cosmic_factor,
+                                                    Session.cosmic_distance,
+                                                    Session.cosmic_cycles),
+        "prepare_batch": lambda: Session.prepare_batch(inputs["clean"]),
+        "labview_map": lambda: load_labview_map(inputs["labview_map"],
+                                                inputs["dimensions"]),
+        "labview_map_gz": lambda: load_labview_map(inputs["labview_map_gz"],
+                                                   inputs["dimensions"]),
+        "mat_map": lambda: load_mat_map(inputs["mat_map"],
+                                        inputs["mat_calibration"]),
+        "load_sweep_gz": lambda: load_sweep(*inputs["sweep"]),
+        "load_sweep_txt": lambda: load_sweep(*inputs["sweep_txt"]),
+        "convert_cube": convert_cube,
+        "adjust_image": lambda: integrated_image(cube, 1.5),
+        "cube_image": lambda: map_cube.integrated_image(1.5),
+        "band_image": lambda: map_cube.band_image(map_cube.channels//4,
+                                                  map_cube.channels//2),
+        "cube_spectra": lambda: [map_cube.spectrum(i, i)
+                                 for i in range(inputs["dimensions"])],
+        "adjust_contrast": lambda: sweep_contrast(sweep, 3, 3, background),
+        "adjust_contrast_cached": lambda: sweep_contrast(
+                                            differential(sweep, sweep[0]), 3, 3),
+        "differential_cube": differential_cube,
+        "fit_map": fit_pixels,
+        "pca_map": lambda: pca(map_cube, 3),
+        "nmf_map": lambda: nmf(map_cube, 3, exciton)})
+
+
+def compare(results, baseline, tolerance, resolution=0.005):
+    '''prints the change against the baseline, returns the regressions.
+    Differences below the resolution (seconds) are considered noise.'''
+    regressions = []
+    print("%-20s %10s %10s %9s %10s" % ("stage", "seconds", "baseline",
+                                        "change", "peak [MB]"))
+    for name, result in results["stages"].items():
+        reference = baseline["stages"].get(name)
+        if reference is None:
+            print("%-20s %10.4f %10s %9s %10.1f" % (name, result["seconds"],
+                                                    "-", "new",
+                                                    result["peak_mb"]))
+            continue
+        change = result["seconds"]/reference["seconds"] - 1
+        memory = result["peak_mb"]/max(reference["peak_mb"], 1.) - 1
+        print("%-20s %10.4f %10.4f %+8.1f%% %10.1f" % (name,
+                                                       result["seconds"],
+                                                       reference["seconds"],
+                                                       100*change,
+                                                       result["peak_mb"]))
+        slower = (change > tolerance
+                  and result["seconds"] - reference["seconds"] > resolution)
+        if slower or memory > tolerance:
+            regressions.append(name)
+    return(regressions)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                description=__doc__,
+                formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(scales), default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="*",
+                        help="only run the given stages")
+    parser.add_argument("--output", help="write the results to a json-file")
+    parser.add_argument("--compare", help="baseline json-file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown (default: 0.25)")
+    arguments = parser.parse_args()
+
+    scale = scales[arguments.scale]
+    results = {"scale": dict(scale, name=arguments.scale),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "machine": platform.machine(),
+               "stages": dict()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        inputs = prepare(directory, scale)
+        measured = quiet(stages)(inputs)
+        for name, function in measured.items():
+            if arguments.stages and name not in arguments.stages:
+                continue
+            results["stages"][name] = quiet(measure)(function, arguments.repeat)
+            print("%-20s %10.4f s %10.1f MB" % (name,
+                                               results["stages"][name]["seconds"],
+                                               results["stages"][name]["peak_mb"]))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=1)
+
+    if arguments.compare:
+        with open(arguments.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, arguments.tolerance)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            return(1)
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+'''Generators for realistic synthetic input data: single spectra, spectral
+maps and gate sweeps, written in the formats the loaders of schmuxi expect.'''
+import os
+import gzip
+import numpy as np
+
+# a WS2-like photoluminescence spectrum: exciton, trion and a weak defect band
+peaks = [(2.01, 0.012, 900), (1.98, 0.015, 350), (1.90, 0.040, 80)]
+hc = 1239.82 #eV*nm
+
+
+def wavelength_axis(pixels, start=550, end=700):
+    '''calibration of a spectrometer with a linear dispersion'''
+    return(np.linspace(start, end, pixels))
+
+
+def photoluminescence(wavelength, scale=1, shift=0, background=100):
+    '''noise free spectrum with lorentzian peaks on a constant background'''
+    energy = hc/wavelength
+    signal = np.full(np.shape(energy), float(background))
+    for centre, width, amplitude in peaks:
+        signal = signal + scale*amplitude/(1 + ((energy - centre - shift)/width)**2)
+    return(signal)
+
+
+def add_cosmics(counts, rate=1e-4, height=5000, seed=None):
+    '''adds single pixel cosmics with the given rate per pixel'''
+    random = np.random.RandomState(seed)
+    hits = random.random_sample(np.shape(counts)) < rate
+    return(counts + hits*random.uniform(0.2, 1, np.shape(counts))*height)
+
+
+def write_spectra(directory, number, pixels, raw=False, seed=0):
+    '''writes synthetic spectra, either cleaned ("wavelength counts") or in
+    the raw LabVIEW-format with decimal commas and filler columns'''
+    random = np.random.RandomState(seed)
+    wavelength = wavelength_axis(pixels)
+    names = []
+    for i in range(number):
+        expected = photoluminescence(wavelength,
+                                     scale=random.uniform(0.2, 2),
+                                     shift=random.normal(0, 0.005))
+        counts = add_cosmics(random.poisson(expected), seed=seed + i)
+        name = "spectrum-%05d-120s-532nm-4K-50uW.txt" % i
+        with open(os.path.join(directory, name), 'w') as spectrum_file:
+            for x, y in zip(wavelength, counts):
+                if raw:
+                    spectrum_file.write(("%.3f" % x).replace('.', ',')
+                                        + "\t1\t1\t%d\n" % y)
+                else:
+                    spectrum_file.write("%.3f %d\n" % (x, y))
+        names.append(name)
+    return(names)
+
+
+def map_cube(dimensions, channels, seed=0):
+    '''spectral map (dimensions x dimensions x channels) with a bright flake
+    and some defect regions on a dark substrate'''
+    random = np.random.RandomState(seed)
+    wavelength = wavelength_axis(channels)
+    position = np.linspace(-1, 1, dimensions)
+    x, y = np.meshgrid(position, position, indexing='ij')
+    flake = 1/(1 + np.exp((np.hypot(x, y) - 0.6)*20))
+    shift = 0.01*np.sin(3*x)*np.cos(2*y)
+    cube = np.empty((dimensions, dimensions, channels), dtype=np.float32)
+    for i in range(dimensions):
+        expected = np.array([photoluminescence(wavelength, flake[i, j], shift[i, j])
+                             for j in range(dimensions)])
+        cube[i] = random.poisson(expected)
+    return(cube, wavelength)
+
+
+def write_labview_map(path, cube, calibration):
+    '''LabVIEW text map: 6 header rows, then one row per channel with the
+    calibration and the spectra of all pixels'''
+    dimensions = cube.shape[0]
+    columns = cube.reshape(dimensions*cube.shape[1], -1).T
+    with open(path, 'w') as map_file:
+        header = np.zeros((6, columns.shape[1] + 1))
+        np.savetxt(map_file, header, fmt="%d")
+        np.savetxt(map_file,
+                   np.column_stack([calibration, columns]),
+                   fmt="%.4f")
+
+
+def write_mat_map(path, cube, calibration_path, calibration):
+    '''.mat map without calibration, which is stored in a separate
+    .tsv.gz-file like wlen_to_px of the setup'''
+    import scipy.io as sio
+    sio.savemat(path, {'spectra': cube})
+    write_column(calibration_path, calibration)
+
+
+def write_column(path, values):
+    '''headerless single column file, gzipped if the name ends with .gz'''
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt') as column_file:
+        np.savetxt(column_file, values, fmt="%.6f")
+
+
+def write_sweep(directory, rows, channels, compressed=True, seed=0):
+    '''gate sweep with one spectrum per voltage, whose peaks shift with the
+    gate. Returns the names of data, wavelength- and voltage calibration.'''
+    random = np.random.RandomState(seed)
+    wavelength = wavelength_axis(channels)
+    voltages = np.linspace(-32, 32, rows)
+    sweep = np.array([random.poisson(photoluminescence(wavelength,
+                                                       shift=0.0005*voltage))
+                      for voltage in voltages])
+    ending = ".tsv.gz" if compressed else ".txt"
+    names = ["sweep.Voltage_Sweep" + ending,
+             "sweep.wlen_to_px" + ending,
+             "sweep.voltages" + ending]
+    opener = gzip.open if compressed else open
+    with opener(os.path.join(directory, names[0]), 'wt') as sweep_file:
+        sweep_file.write("\t".join(str(i) for i in range(channels)) + "\n")
+        np.savetxt(sweep_file, sweep, fmt="%d", delimiter="\t")
+    write_column(os.path.join(directory, names[1]), wavelength)
+    write_column(os.path.join(directory, names[2]), voltages)
+    return(names)
+
+
+def compress(directory, names, target, suffix=".gz"):
+    '''writes compressed copies of the given files into target. Returns the
+    names of the copies.'''
+    from compressed import openers
+    compressed = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as plain:
+            with openers[suffix](os.path.join(target, name + suffix),
+                                 'wb') as packed:
+                packed.write(plain.read())
+        compressed.append(name + suffix)
+    return(compressed)
@@ -0,0 +1,140 @@
+'''Command line interface for batch jobs.
+
+schmuxi params [FILES]   prints the parameters found in the file names
+schmuxi export           writes every spectrum in working_dir into a csv-file
+schmuxi plot             publishes every spectrum in working_dir as png
+schmuxi index            lists the spectra in the index of working_dir
+
+export, plot and index accept filters on the indexed parameters, e.g.
+    schmuxi plot --where temperature=4 excitation=530 power=10:100
+
+Heavy dependencies (pandas, matplotlib) are only imported by the commands,
+that need them, so short jobs start quickly.'''
+import os
+import sys
+import argparse
+from glob import glob
+
+# the modules of schmuxi import each other as top-level scripts
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def params(arguments):
+    '''prints the parameters of every given file'''
+    from autofind_paras import open_config, find_parameters
+    cfg = open_config(arguments.config)
+    from compressed import patterns
+    files = arguments.files or sorted(entry for pattern in patterns('*.txt')
+                                      for entry in glob(pattern))
+    for spec in files:
+        print(os.path.basename(spec), find_parameters(os.path.basename(spec), cfg))
+
+
+def number(value):
+    '''value as a float, None if it is not numeric'''
+    try:
+        return(float(value))
+    except ValueError:
+        return(None)
+
+
+def filters(conditions):
+    '''parses KEY=VALUE or KEY=LOW:HIGH into filters of the spectra index.
+    Values, that are not numeric, are compared as text.'''
+    parsed = dict()
+    for condition in conditions:
+        key, value = condition.split("=", 1)
+        limits = value.split(":", 1)
+        if len(limits) == 2 and all(limit == "" or number(limit) is not None
+                                    for limit in limits):
+            parsed[key] = tuple(number(limit) for limit in limits)
+        elif number(value) is not None:
+            parsed[key] = number(value)
+        else:
+            parsed[key] = value
+    return(parsed)
+
+
+def selection(Session, arguments):
+    '''spectra matching the --where filters, None if there are none'''
+    if not arguments.where:
+        return(None)
+    return(Session.select(**filters(arguments.where)))
+
+
+def export(arguments):
+    '''writes all spectra of the working directory into csv-files'''
+    from spec_evaluation import Experiment
+    Session = Experiment(config_source=arguments.config)
+    exported = Session.export_all_spectra(force=arguments.force,
+                                          specs=selection(Session, arguments))
+    print("Exported " + str(len(exported)) + " spectra")
+
+
+def plot(arguments):
+    '''publishes all spectra of the working directory as png-files'''
+    import matplotlib
+    matplotlib.use('Agg')
+    from spec_evaluation import Experiment
+    Session = Experiment(config_source=arguments.config)
+    results = Session.plot_all_spectra(workers=arguments.workers,
+                                       force=arguments.force,
+                                       specs=selection(Session, arguments))
+    failed = [spec for spec, error in results if error is not None]
+    print("Published " + str(len(results) - len(failed)) + " spectra")
+    return(1 if failed else 0)
+
+
+def index(arguments):
+    '''updates the index of the working directory and lists the matching
+    spectra'''
+    from spec_evaluation import Experiment
+    Session = Experiment(config_source=arguments.config)
+    for spec in Session.select(**filters(arguments.where)):
+        print(spec)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+                prog="schmuxi",
+                description=__doc__,
+                formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="spec_config.yml",
+                        help="configuration file (default: spec_config.yml)")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    params_parser = commands.add_parser("params", help=params.__doc__)
+    params_parser.add_argument("files", nargs="*")
+    params_parser.set_defaults(run=params)
+
+    export_parser = commands.add_parser("export", help=export.__doc__)
+    export_parser.add_argument("--force", action="store_true",
+                               help="export also spectra, that are up to date")
+    export_parser.add_argument("--where", nargs="*", default=[],
+                               metavar="KEY=VALUE",
+                               help="only spectra with these parameters")
+    export_parser.set_defaults(run=export)
+
+    plot_parser = commands.add_parser("plot", help=plot.__doc__)
+    plot_parser.add_argument("--force", action="store_true",
+                             help="plot also spectra, that are up to date")
+    plot_parser.add_argument("--workers", type=int, default=None,
+                             help="number of parallel processes")
+    plot_parser.add_argument("--where", nargs="*", default=[],
+                             metavar="KEY=VALUE",
+                             help="only spectra with these parameters")
+    plot_parser.set_defaults(run=plot)
+
+    index_parser = commands.add_parser("index", help=index.__doc__)
+    index_parser.add_argument("--where", nargs="*", default=[],
+                              metavar="KEY=VALUE",
+                              help="only spectra with these parameters")
+    index_parser.set_defaults(run=index)
+
+    arguments = parser.parse_args(argv)
+    return(arguments.run(arguments))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+'''Transparent reading of compressed input files.
+
+Raw data, sweeps and calibrations are often archived as .gz (or .xz, .bz2,
+.zst) files. open_input() returns a stream, that decompresses chunk by chunk
+while it is read, so no temporary files are written and only the read chunks
+are kept in memory. Uncompressed files are opened as they are. zstd needs
+Python >= 3.14 or the zstandard package.'''
+import io
+import os
+import gzip
+import bz2
+import lzma
+
+compressions = [".gz", ".xz", ".bz2", ".zst"]
+
+
+def open_zstd(path, mode='rb'):
+    '''opens a zstd-compressed file for reading'''
+    try:
+        from compression import zstd
+    except ImportError:
+        pass
+    else:
+        return(zstd.open(path, mode))
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading " + path + " needs the zstandard package.")
+    stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'),
+                                                         closefd=True)
+    if 't' in mode:
+        return(io.TextIOWrapper(stream))
+    return(stream)
+
+
+openers = {".gz": gzip.open,
+           ".xz": lzma.open,
+           ".bz2": bz2.open,
+           ".zst": open_zstd}
+
+
+def compression(path):
+    '''suffix of the compression of a file, None for plain files'''
+    suffix = os.path.splitext(path)[1].lower()
+    return(suffix if suffix in compressions else None)
+
+
+def strip_compression(path):
+    '''name of the file without the suffix of its compression:
+    spectrum.txt.gz -> spectrum.txt'''
+    if compression(path) is None:
+        return(path)
+    return(os.path.splitext(path)[0])
+
+
+def base_name(path):
+    '''name without compression and file ending: spectrum.txt.gz -> spectrum'''
+    return(os.path.splitext(strip_compression(path))[0])
+
+
+def open_input(path, mode='rb'):
+    '''opens a plain or compressed file for reading ('rb' or 'rt')'''
+    suffix = compression(path)
+    if suffix is None:
+        return(open(path, mode))
+    return(openers[suffix](path, mode))
+
+
+def read_bytes(path):
+    '''whole content of a plain or compressed file'''
+    with open_input(path, 'rb') as input_file:
+        return(input_file.read())
+
+
+def patterns(pattern):
+    '''glob patterns for the plain and all compressed versions of a
+    pattern, e.g. *.txt -> *.txt, *.txt.gz, ...'''
+    return([pattern] + [pattern + suffix for suffix in compressions])
@@ -0,0 +1,93 @@
+'''Vectorized removal of "cosmics", random high intensity peaks, from a stack
+of spectra (N spectra x M pixels).
+
+Every pixel is compared with the median of its neighbourhood of
++-cosmic_distance pixels. A pixel counts as a cosmic, if it exceeds that
+median by more than cosmic_factor times the median absolute deviation (MAD)
+of the neighbourhood. Flagged pixels are replaced by the rolling median.
+
+The test only depends on the spread of the neighbourhood, so it works the
+same on raw counts, normalised and rate converted spectra. As the MAD of a
+few pixels scatters a lot (and is 0 on flat edges), the noise of the whole
+spectrum, estimated from the differences of neighbouring pixels, is its
+lower limit. For raw counts, shot_noise=True additionally uses the poisson
+noise sqrt(median) as lower limit.'''
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# conversion of the MAD into a standard deviation for gaussian noise
+mad_scale = 1.4826
+# the same for the mean absolute deviation
+mean_deviation_scale = np.sqrt(np.pi/2)
+# number of spectra processed at once, limits the size of the window-views
+chunk_size = 256
+
+
+def rolling_median(stack, distance):
+    '''returns rolling median and MAD over a window of +-distance pixels for
+    every row of a 2D-array. The edges are padded with the edge value.'''
+    padded = np.pad(stack, ((0, 0), (distance, distance)), mode='edge')
+    windows = sliding_window_view(padded, 2*distance + 1, axis=1)
+    median = np.median(windows, axis=2)
+    mad = np.median(np.abs(windows - median[:, :, np.newaxis]), axis=2)
+    return(median, mad)
+
+
+def spectrum_noise(stack):
+    '''noise of every row of a 2D-array, estimated from the differences of
+    neighbouring pixels (robust against peaks and cosmics). Rows, whose
+    differences are mostly 0 (low counts), use their mean instead.'''
+    differences = np.abs(np.diff(stack, axis=1))/np.sqrt(2)
+    noise = mad_scale*np.median(differences, axis=1)
+    flat = noise == 0
+    noise[flat] = mean_deviation_scale*np.mean(differences[flat], axis=1)
+    return(noise)
+
+
+def flag_cosmics(stack, cosmic_factor, cosmic_distance, shot_noise=False):
+    '''returns a boolean mask of the pixels identified as cosmics together
+    with the rolling median, that is used to replace them. shot_noise=True
+    takes the values as counts and uses their poisson noise as lower limit
+    of the noise.'''
+    median, mad = rolling_median(stack, cosmic_distance)
+    noise = np.maximum(mad_scale*mad, spectrum_noise(stack)[:, np.newaxis])
+    if shot_noise:
+        noise = np.maximum(noise, np.sqrt(np.abs(median)))
+    # a constant neighbourhood: only rounding is no cosmic
+    noise = np.maximum(noise, np.finfo(float).eps*np.abs(median))
+    mask = (stack - median) > cosmic_factor*noise
+    return(mask, median)
+
+
+def erase_cosmics(stack, cosmic_factor, cosmic_distance, cosmic_cycles=1,
+                  shot_noise=False):
+    '''Removes cosmics from a single spectrum (1D) or a stack of spectra (2D).
+    Flagged pixels are replaced with the rolling median of their
+    neighbourhood. Further cycles are only run, as long as new cosmics are
+    found (e.g. broad cosmics hiding behind each other). shot_noise=True
+    is meant for raw counts, see flag_cosmics.
+    Returns the cleaned copy and the mask of all erased pixels.'''
+    data = np.asarray(stack, dtype=float)
+    single = data.ndim == 1
+    cleaned = np.atleast_2d(data).copy()
+    erased = np.zeros(cleaned.shape, dtype=bool)
+    if cosmic_distance < 1 or cleaned.shape[1] < 3:
+        return((cleaned[0], erased[0]) if single else (cleaned, erased))
+
+    for start in range(0, cleaned.shape[0], chunk_size):
+        rows = np.arange(start, min(start + chunk_size, cleaned.shape[0]))
+        for i in range(max(cosmic_cycles, 1)):
+            mask, median = flag_cosmics(cleaned[rows],
+                                        cosmic_factor,
+                                        cosmic_distance,
+                                        shot_noise)
+            if not mask.any():
+                break
+            cleaned[rows] = np.where(mask, median, cleaned[rows])
+            erased[rows] |= mask
+            # only spectra with new cosmics are checked again
+            rows = rows[mask.any(axis=1)]
+
+    if single:
+        return(cleaned[0], erased[0])
+    return(cleaned, erased)
@@ -0,0 +1,99 @@
+'''Decimation of spectra, before they are sent to the browser.
+
+Spectra often have far more channels than the plot has pixels. The viewers
+keep the full spectrum on the server and only send the points, that are
+chosen by the largest-triangle-three-buckets algorithm (LTTB): the spectrum
+is divided into buckets and from every bucket the point spanning the largest
+triangle with the point kept before and the mean of the next bucket is
+kept. As LTTB may miss the very top of narrow peaks, the maximum of every
+bucket, that is higher than the maxima of both neighbouring buckets, is kept
+as well. Peaks and edges survive, flat noise is thinned out. When the user
+zooms in, the visible window is decimated again, so details appear. The
+points are sent as numpy arrays, which bokeh transfers in binary form.'''
+import numpy as np
+
+# points sent per spectrum, about twice the width of the plots
+default_points = 1000
+
+
+def lttb(x, y, points=default_points):
+    '''indices of the points kept by largest-triangle-three-buckets and the
+    tops of the peaks (so a few more than points). The first and the last
+    point are always kept. Spectra of less than twice as many points are
+    not worth decimating and are kept completely.'''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    length = len(x)
+    if 2*points >= length or points < 3:
+        return(np.arange(length))
+
+    # points - 2 buckets between the first and the last point
+    edges = np.linspace(1, length - 1, points - 1).astype(int)
+    sum_x = np.concatenate([[0.], np.cumsum(x)])
+    sum_y = np.concatenate([[0.], np.nancumsum(y)])
+    sizes = np.diff(edges)
+    mean_x = (sum_x[edges[1:]] - sum_x[edges[:-1]])/sizes
+    mean_y = (sum_y[edges[1:]] - sum_y[edges[:-1]])/sizes
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    keep = np.empty(points, dtype=int)
+    keep[0] = 0
+    keep[-1] = length - 1
+    kept = 0
+    for bucket in range(points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        area = np.abs((x[kept] - mean_x[bucket])*(y[start:stop] - y[kept])
+                      - (x[kept] - x[start:stop])*(mean_y[bucket] - y[kept]))
+        kept = start + np.argmax(np.nan_to_num(area, nan=-1.))
+        keep[bucket + 1] = kept
+
+    finite = np.nan_to_num(y[:-1], nan=-np.inf)
+    highest = np.concatenate([[-np.inf],
+                              np.maximum.reduceat(finite, edges[:-1]),
+                              [-np.inf]])
+    peaks = np.flatnonzero((highest[1:-1] > highest[:-2])
+                           & (highest[1:-1] > highest[2:]))
+    tops = [edges[bucket] + np.argmax(finite[edges[bucket]:edges[bucket + 1]])
+            for bucket in peaks]
+    return(np.union1d(keep, tops).astype(int))
+
+
+def window(x, start=None, end=None):
+    '''indices of the points between start and end, including one
+    neighbour on each side, so that the line reaches the border'''
+    inside = np.ones(len(x), dtype=bool)
+    if start is not None:
+        inside &= x >= min(start, end if end is not None else start)
+    if end is not None:
+        inside &= x <= max(end, start if start is not None else end)
+    indices = np.flatnonzero(inside)
+    if len(indices) == 0:
+        return(np.arange(len(x)))
+    return(np.arange(max(indices[0] - 1, 0), min(indices[-1] + 2, len(x))))
+
+
+class DecimatedLine:
+    '''Keeps the full spectrum of a line glyph and sends a decimated version
+    of the visible part to its data source'''
+
+    def __init__(self, source, points=default_points):
+        self.source = source
+        self.points = points
+        self.x = np.array([])
+        self.y = np.array([])
+
+
+    def show(self, x, y, start=None, end=None):
+        '''replaces the spectrum and sends the points within start and end'''
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.refine(start, end)
+
+
+    def refine(self, start=None, end=None):
+        '''sends the decimated points between start and end again, e.g.
+        after the user zoomed'''
+        visible = window(self.x, start, end)
+        keep = visible[lttb(self.x[visible], self.y[visible], self.points)]
+        self.source.data = {"x": self.x[keep], "y": self.y[keep]}
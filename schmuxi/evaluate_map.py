@@ -5,17 +5,25 @@ bokeh serve --show evaluate_map.py
 
 Make sure, you have a config_file with the right name in the same folder.'''
 import numpy as np
-import matplotlib.pyplot as plt
 import yaml
 from bokeh.plotting import curdoc, gridplot, figure, show, output_file
 from bokeh.layouts import column, widgetbox, layout
 from bokeh.models.widgets import CheckboxButtonGroup, Select, MultiSelect, TextInput
-from bokeh.models import Button, TapTool, Slider, RangeSlider
+from bokeh.models import Button, TapTool, Slider, RangeSlider, ColumnDataSource
 from bokeh.events import Tap
-import scipy.io as sio
+import os
 import pandas as pd
 import random
 from spec_evaluation import Experiment
+from telemetry import telemetry, timed
+from decimate import DecimatedLine
+from axis_registry import intern_axis
+from map_cube import labview_cube, mat_cube, default_directory, channel_band
+from image_tools import power_image, pyramid, pyramid_level, layer_image
+from map_fitting import fit_map
+from map_decomposition import decompose, methods
+from fit_analysis import models
+from compressed import strip_compression
 
 # --- Configration ---
 
@@ -30,87 +38,113 @@ source_dir = cfg["general"]["source_path"]
 working_dir = cfg["general"]["working_dir"]
 working_file = cfg["map_paras"]["file"]
 calibration_file = cfg["map_paras"]["calibration_file"]
+# maps are converted once into memory mapped cubes
+cube_dir = os.path.join(working_dir, default_directory)
 
 # --- Function Declarations ---
 
 def labview_map(working_file):
-    raw = np.loadtxt(working_dir + working_file)
-    data = raw[6:]
-    data3d = np.stack(np.vsplit(np.transpose(data)[1:],dimensions))-background
-    calibration = data[:,0]
-    dim_x = dimensions
-    dim_y = dimensions
-    return(data3d, calibration, dim_x, dim_y)
+    cube = labview_cube(working_dir + working_file,
+                        dimensions,
+                        background,
+                        cube_dir)
+    return(cube, cube.calibration, cube.dim_x, cube.dim_y)
 
 
 def mat_map(working_file, reset_background=True):
     '''Loads a .mat file that describes a spectral map'''
     print(source_dir + working_file)
-    data = sio.loadmat(source_dir + working_file)
-    print("nailed it")
-    data3d = data['spectra']
-    dim_x = np.shape(data3d)[0]
-    dim_y = np.shape(data3d)[1]
-    if reset_background == True:
-        background = 0
-    data3d -= background
-    try:
-        calibration = data['wlen_to_px'][0,0]
-        print("I tried")
-    except:
-        calibration_data = pd.read_csv(source_dir + calibration_file, '\t', header=None)
-        calibration = np.array(list(calibration_data[0]))
-    return(data3d, calibration, dim_x, dim_y)
+    cube = mat_cube(source_dir + working_file,
+                    source_dir + calibration_file,
+                    0 if reset_background == True else background,
+                    cube_dir)
+    return(cube, cube.calibration, cube.dim_x, cube.dim_y)
 
 
+@timed("display_spectrum")
 def display_spectrum(event):
     '''Display the spectrum for the clicked/tapped point on the map'''
+    global current_spectrum
+    pixel = (int(np.round(event.x)), int(np.round(event.y)))
+    current_spectrum = data3d.spectrum(*pixel)
     new_data = dict()
     new_data["x"] = x2
-    new_data["y"] = data3d[int(np.round(event.x)),int(np.round(event.y)),:]
-    print(use_background == True)
-    if use_background == True:
-        print("background is true")
-        new_data["y"] = (-new_data["y"]+background_spec)/(background_spec)#'''+new_data["y"]''')
+    # with a background, the spectrum is taken from the differential cube
+    new_data["y"] = shown.spectrum(*pixel)
 
-    ds.data = new_data
+    line.show(new_data["x"], new_data["y"], spec.x_range.start, spec.x_range.end)
 
 
+@timed("switch_calibration")
 def switch_calibration():
     '''switch between energy [eV] and wavelength [nm]'''
     global x2
-    x2 = 1239.8/x2
+    x2 = axis.wavelength if x2 is axis.energy else axis.energy
     Session.convert_to_energy = not Session.convert_to_energy
+    wavelength_slider.update(start=np.min(x2),
+                             end=np.max(x2),
+                             step=(np.max(x2)-np.min(x2))/500,
+                             value=(np.min(x2), np.max(x2)),
+                             title='Energy Range' if x2 is axis.energy else 'Wavelength Range')
+    if decomposition is not None:
+        show_components()
 
 
+@timed("adjust_marker")
 def adjust_marker(attr, old, new):
     '''adjust the position of the marker'''
     new_data = dict()
     new_data["x"] = [min(x2)+marker_slider.value*(max(x2)-min(x2)), min(x2)+marker_slider.value*(max(x2)-min(x2))]
-    new_data["y"] = [0,max(ds.data["y"])]
+    new_data["y"] = [0,np.nanmax(line.y)]
     ds2.data = new_data
 
 
+@timed("refine_spectrum")
+def refine_spectrum(attr, old, new):
+    '''sends the visible part of the spectrum again, when the user zooms'''
+    line.refine(spec.x_range.start, spec.x_range.end)
+
+
+def show_differential():
+    '''shows the differential reflectance (background - R)/background of the
+    whole map, or the map itself without background'''
+    global shown, levels, layers, decomposition
+    if use_background == True and background_spec is not None:
+        shown = data3d.differential(background_spec)
+    else:
+        shown = data3d
+    # the parameter and abundance maps belong to the cube shown before
+    layers = dict()
+    decomposition = None
+    component_source.data = {"xs": [], "ys": [], "line_color": []}
+    layer_select.update(options=["Intensity"], value="Intensity")
+    levels = band_image()
+    show_image()
+
+
+@timed("select_background")
 def select_background():
     '''select current spectrum for differential display'''
     global background_spec
     global use_background
     use_background = True
-    background_spec = ds.data["y"]
-    print(background_spec)
-    print(use_background == True)
+    background_spec = current_spectrum
+    show_differential()
 
 
-def use_background():
+@timed("switch_background")
+def switch_background():
     global use_background 
     use_background = not use_background
+    show_differential()
 
 
+@timed("publish")
 def publish():
     '''publishes the currently displayed spectrum, using spec_evaluation.py'''
     # Bad things can happen here. Find out and fix!
-    publish_x = ds.data["x"]
-    publish_y = ds.data["y"]
+    publish_x = line.x
+    publish_y = line.y
     publish_data = pd.DataFrame({'index': publish_x, 'values': publish_y})
     erase_cosmics = True
     y_scale = None
@@ -130,41 +164,135 @@ def publish():
     Session.save_as_csv(publish_data, export_name.value + '.csv')
 
 
+def band_image():
+    '''pyramid of the map integrated over the selected band, taken from the
+    prefix index, or of the selected parameter or abundance map'''
+    if layer_select.value in layers:
+        return(pyramid(layer_image(layers[layer_select.value])))
+    return(pyramid(shown.band_image(*band)))
+
+
+def show_image():
+    '''shows the pyramid level matching the zoom with the current contrast.
+    Only the data of the existing image glyph is replaced.'''
+    z = power_image(levels[level], contrast_slider.value, np.nanmax(np.abs(levels[0])))
+    map_image.data_source.data = {"image": [z.transpose((1,0))]}
+
+
+@timed("adjust_band")
+def adjust_band(attr, old, new):
+    '''integrates the map live over the range of the slider'''
+    global band, levels
+    selected = channel_band(x2, *new)
+    if selected[1] > selected[0]:
+        band = selected
+        levels = band_image()
+        show_image()
+
+
+@timed("fit_all_pixels")
+def fit_all_pixels():
+    '''fits the selected model to every pixel within the selected band and
+    offers the parameter maps as image layers'''
+    for name in [name for name in layers if name.split("_")[0] not in methods]:
+        del layers[name]
+    layers.update(fit_map(shown,
+                          x2,
+                          fit_model.value,
+                          int(fit_peaks.value),
+                          band))
+    print("Fitted " + str(int(np.sum(np.isfinite(layers["residual"]))))
+          + " pixels")
+    layer_select.options = ["Intensity"] + sorted(layers)
+
+
+@timed("decompose_map")
+def decompose_map():
+    '''decomposes the map within the selected band into component spectra,
+    which are plotted, and abundance maps, which are offered as image
+    layers'''
+    global decomposition
+    for name in [name for name in layers if name.split("_")[0] in methods]:
+        del layers[name]
+    decomposition = decompose(shown,
+                              decomposition_method.value,
+                              int(decomposition_components.value),
+                              band)
+    layers.update(decomposition.maps())
+    layer_select.options = ["Intensity"] + sorted(layers)
+    show_components()
+
+
+def show_components():
+    '''plots the component spectra of the last decomposition'''
+    start, stop = decomposition.band
+    component_source.data = {
+            "xs": [x2[start:stop]]*len(decomposition.components),
+            "ys": list(decomposition.components),
+            "line_color": [component_palette[i%len(component_palette)]
+                           for i in range(len(decomposition.components))]}
+
+
+@timed("select_layer")
+def select_layer(attr, old, new):
+    '''shows the integrated intensity, a parameter map of the fit or an
+    abundance map of the decomposition'''
+    global levels
+    levels = band_image()
+    show_image()
+
+
+@timed("adjust_zoom")
+def adjust_zoom(attr, old, new):
+    '''switches to the pyramid level matching the visible part of the map'''
+    global level
+    visible = max(spec_map.x_range.end - spec_map.x_range.start,
+                  spec_map.y_range.end - spec_map.y_range.start)
+    new_level = pyramid_level(levels, visible, min(spec_map.width, spec_map.height))
+    if new_level != level:
+        level = new_level
+        show_image()
+
+
+@timed("adjust_image")
 def adjust_image():
     '''adjust contrast and ranges'''
-    z = np.sum(data3d, axis=2)
-    z = z/np.max(z)
-    z = np.power(z, contrast_slider.value)
-    
-    map_image = spec_map.image(image=[z.transpose((1,0))],
-                               x=0, y=0,
-                               dw=np.shape(z)[0],
-                               dh=np.shape(z)[1],
-                               palette="Inferno256")
-    spec_map.on_event(Tap, display_spectrum)
+    show_image()
 
 
 # --- Skript starts ---
 
-if working_file[-4:] == ".txt":
+if strip_compression(working_file)[-4:] == ".txt":
     data3d, calibration, dim_x, dim_y = labview_map(working_file)
-elif working_file[-4:] == ".mat":
+elif strip_compression(working_file)[-4:] == ".mat":
     data3d, calibration, dim_x, dim_y = mat_map(working_file)
 else:
     print("Nope. Your file is some serious bullshit. You will hear from me later.")
 
 x = np.repeat(range(dim_x),dim_x)
 y = np.tile(range(dim_y),dim_y)
-z = np.sum(data3d,axis=2)
-z = z/np.max(z)
+band = (0, data3d.channels)
+use_background = False
+background_spec = None
+current_spectrum = None
+shown = data3d
+layers = dict()
+decomposition = None
+layer_select = Select(title="Image Layer",
+                      value="Intensity",
+                      options=["Intensity"])
+layer_select.on_change('value', select_layer)
+levels = band_image()
+level = pyramid_level(levels, max(dim_x, dim_y), 500)
+z = power_image(levels[level], 1, np.max(np.abs(levels[0])))
 
 print(z)
 Session = Experiment()
 Session.convert_to_energy = True
 
 print(calibration)
-x2=1239.8/calibration
-##use_background = False
+axis = intern_axis(calibration)
+x2 = axis.energy
 
 # --- Data Visualization ---
 
@@ -175,10 +303,24 @@ spec = figure(width=500, height = 500, tools=TOOLS)
 
 map_image = spec_map.image(image=[z.transpose((1,0))],
                             x=0, y=0,
-                            dw=np.shape(z)[0],
-                            dh=np.shape(z)[1],
+                            dw=dim_x,
+                            dh=dim_y,
                             palette="Inferno256")
 spec_map.on_event(Tap, display_spectrum)
+for a_range in [spec_map.x_range, spec_map.y_range]:
+    a_range.on_change('start', adjust_zoom)
+    a_range.on_change('end', adjust_zoom)
+
+# component spectra of the decomposition
+components_plot = figure(width=500, height=300, tools=TOOLS,
+                         title="Components")
+component_palette = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728",
+                     "#9467bd", "#8c564b", "#e377c2", "#7f7f7f"]
+component_source = ColumnDataSource({"xs": [], "ys": [], "line_color": []})
+component_lines = components_plot.multi_line(xs="xs",
+                                             ys="ys",
+                                             line_color="line_color",
+                                             source=component_source)
 
 
 # --- Interfaces ---
@@ -188,6 +330,10 @@ r = spec.line(x=[],y=[], line_color="red")
 marker = spec.line(x=[marker_start_x,marker_start_x],y=[0,10], line_color="green")
 ds = r.data_source
 ds2 = marker.data_source
+# the full spectrum stays on the server, the plot gets a decimated version
+line = DecimatedLine(ds)
+spec.x_range.on_change('start', refine_spectrum)
+spec.x_range.on_change('end', refine_spectrum)
 
 marker_slider = Slider(start=0,
                        end=1,
@@ -216,12 +362,39 @@ wavelength_slider = RangeSlider(start=np.min(x2),
                                 step=(np.max(x2)-np.min(x2))/500,
                                 value=(np.min(x2), np.max(x2)),
                                 title='Energy Range')
+wavelength_slider.on_change('value', adjust_band)
 
 background_selection = Button(label="Select Background Spectrum")
 background_selection.on_click(select_background)
 
 background_switch = Button(label="Reset Background")
-background_switch.on_click(use_background)
+background_switch.on_click(switch_background)
+
+fit_model = Select(title="Fit Model",
+                   value="lorentz",
+                   options=list(models))
+
+fit_peaks = Slider(start=1,
+                   end=4,
+                   value=1,
+                   step=1,
+                   title="Peaks")
+
+fit_button = Button(label="Fit All Pixels")
+fit_button.on_click(fit_all_pixels)
+
+decomposition_method = Select(title="Decomposition",
+                              value="nmf",
+                              options=methods)
+
+decomposition_components = Slider(start=1,
+                                  end=8,
+                                  value=3,
+                                  step=1,
+                                  title="Components")
+
+decomposition_button = Button(label="Decompose Map")
+decomposition_button.on_click(decompose_map)
 
 map_type = Select(title="Map Type", 
                   value="Photoluminescence",
@@ -242,6 +415,7 @@ export_name = TextInput(value=random_default, title="File Name")
 
 panel = gridplot([[spec_map, spec]])
 
+curdoc().on_session_destroyed(lambda session_context: telemetry.report())
 curdoc().add_root(layout([[panel,
                            column(marker_slider,
                                   wavelength_slider,
@@ -252,5 +426,13 @@ curdoc().add_root(layout([[panel,
                                   background_switch)],
                            [column(map_type,
                                    export_name,
-                                   publish_button)]]))
+                                   publish_button),
+                            column(fit_model,
+                                   fit_peaks,
+                                   fit_button,
+                                   layer_select),
+                            column(decomposition_method,
+                                   decomposition_components,
+                                   decomposition_button),
+                            components_plot]]))
 
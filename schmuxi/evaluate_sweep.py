@@ -5,16 +5,20 @@ bokeh serve --show evaluate_map.py
 
 Make sure, you have a config_file with the right name in the same folder.'''
 import numpy as np
-import matplotlib.pyplot as plt
 import yaml
 from bokeh.plotting import curdoc, gridplot, figure, show, output_file
 from bokeh.layouts import column, widgetbox, layout
 from bokeh.models.widgets import CheckboxButtonGroup, Select, MultiSelect, TextInput
 from bokeh.models import Button, TapTool, Slider
 from bokeh.events import Tap
-import scipy.io as sio
 import pandas as pd
 from spec_evaluation import Experiment
+from telemetry import telemetry, timed
+from decimate import DecimatedLine
+from spectrum_cache import cache_from_config
+from axis_registry import intern_axis
+from map_io import load_sweep
+from image_tools import sweep_contrast, sweep_differential, ReferenceCache
 from math import e
 
 
@@ -29,17 +33,18 @@ working_file = cfg["sweep_paras"]["file"]
 calibration_wavelength = cfg["sweep_paras"]["calibration_wavelength"]
 calibration_parameters = cfg["sweep_paras"]["calibration_parameter"]
 background_file = cfg["sweep_paras"]["background_file"]
+cache = cache_from_config(cfg)
 
 # --- Function Declarations ---
 
 def load_file(working_file, seperator="\t"):
     '''loads a .tsv-file and initializes the sweep-data'''
-    data = pd.read_csv(source_dir + working_file, seperator)
-    data_matrix = data.as_matrix()
-    calibration_wave = pd.read_csv(source_dir + calibration_wavelength, '\t', header=None)
-    calibration_wave_list = np.array(list(calibration_wave[0]))
-    calibration_param = pd.read_csv(source_dir + calibration_parameters, '\t', header=None)
-    calibration_param_list = np.array(list(calibration_param[0]))
+    data_matrix, calibration_wave_list, calibration_param_list = load_sweep(
+                                    source_dir + working_file,
+                                    source_dir + calibration_wavelength,
+                                    source_dir + calibration_parameters,
+                                    seperator,
+                                    cache)
     print(np.shape(data_matrix))
     print(np.shape(calibration_wave_list))
     return(data_matrix,
@@ -59,65 +64,63 @@ def load_background(number_of_lines):
     return (background_list, background)
 
 
+@timed("display_spectrum")
 def display_spectrum(event):
     '''Display the spectrum for the clicked/tapped point on the map'''
     new_data = dict()
     new_data["x"] = x2
-    new_data["y"] = sweep[int(np.round(event.y)),:]
-    
-    if background_check.active[0] == 0:
-        new_data["y"] = (new_data["y"]-background_list)/(new_data["y"] + background_list + 0.02)
-    ds.data = new_data
+    new_data["y"] = shown_sweep()[int(np.round(event.y)),:]
+    line.show(new_data["x"], new_data["y"], spec.x_range.start, spec.x_range.end)
 
 
+@timed("switch_calibration")
 def switch_calibration():
     '''switch between energy [eV] and wavelength [nm]'''
     global x2
-    x2 = 1239.8/x2
+    x2 = axis.wavelength if x2 is axis.energy else axis.energy
     Session.convert_to_energy = not Session.convert_to_energy
 
 
-def adjust_contrast():
-    '''adjusts contrast by mapping the values on a power-law and clipping high
-    values'''
-    z = sweep
-
-    global background
+def shown_sweep():
+    '''the sweep or, with background, its differential signal, which is
+    computed once per background spectrum'''
     if background_check.active[0] == 0:
-        print(z + background)
-        z = (z - background)/(z + background + 0.1)
-    
-    #Prototype --
+        return(differential(sweep, background_list))
+    return(sweep)
 
-    min_egy = 1.501
-    max_egy = 1.800
-    
 
-    z = np.clip(z, 0, np.median(z)*threshold_slider.value)
-    z = z/(np.max(z) + 0.02)
-    z = np.power(z, contrast_slider.value)
-     
+@timed("adjust_contrast")
+def adjust_contrast():
+    '''adjusts contrast by mapping the values on a power-law and clipping high
+    values'''
+    z = sweep_contrast(shown_sweep(),
+                       threshold_slider.value,
+                       contrast_slider.value)
 
-    stripe_image = sweep_figure.image(image=[z], 
-                                      x=0, y=0,
-                                      dw=np.shape(z)[1],
-                                      dh=np.shape(z)[0],
-                                      palette="Inferno256")
+    z_datasource.data = {"image": [z]}
 
 
+@timed("adjust_marker")
 def adjust_marker(attr, old, new):
     '''adjust the position of the marker'''
     new_data = dict()
     new_data["x"] = [min(x2)+marker_slider.value*(max(x2)-min(x2)), min(x2)+marker_slider.value*(max(x2)-min(x2))]
-    new_data["y"] = [0,max(ds.data["y"])]
+    new_data["y"] = [0,np.nanmax(line.y)]
     ds2.data = new_data
 
 
+@timed("refine_spectrum")
+def refine_spectrum(attr, old, new):
+    '''sends the visible part of the spectrum again, when the user zooms'''
+    line.refine(spec.x_range.start, spec.x_range.end)
+
+
+@timed("publish")
 def publish():
     '''publishes the currently displayed spectrum, using spec_evaluation.py'''
     # Bad things can happen here. Find out and fix!
-    publish_x = ds.data["x"]
-    publish_y = ds.data["y"]
+    publish_x = line.x
+    publish_y = line.y
     publish_data = pd.DataFrame({'index': publish_x, 'values': publish_y})
     erase_cosmics = True
     y_scale = None
@@ -153,9 +156,11 @@ z = z/np.max(z)
 Session = Experiment()
 Session.convert_to_energy = False
 
-x2=1239.8/calibration_wave
+axis = intern_axis(calibration_wave)
+x2 = axis.energy
 
 background_list, background = load_background(np.shape(z)[0])
+differential = ReferenceCache(sweep_differential)
 # --- Data Visualization ---
 
 TOOLS="hover,crosshair,pan,wheel_zoom,box_zoom,reset,tap,previewsave"
@@ -181,6 +186,10 @@ r = spec.line(x=[],y=[], line_color="red")
 marker = spec.line(x=[marker_start_x,marker_start_x],y=[0,10], line_color="green")
 ds = r.data_source
 ds2 = marker.data_source
+# the full spectrum stays on the server, the plot gets a decimated version
+line = DecimatedLine(ds)
+spec.x_range.on_change('start', refine_spectrum)
+spec.x_range.on_change('end', refine_spectrum)
 
 marker_slider = Slider(start=0,
                        end=1,
@@ -223,6 +232,7 @@ sweep_type = Select(title="Sweep Type",
 
 panel = gridplot([[sweep_figure, spec]])
 
+curdoc().on_session_destroyed(lambda session_context: telemetry.report())
 curdoc().add_root(column(marker_slider, energy_wavelength, panel,
     publish_button, contrast_slider, contrast_button, threshold_slider,
     background_check, export_name, sweep_type))
@@ -1,59 +1,140 @@
 import numpy as np
-import pandas as pd
-import yaml
 from scipy.optimize import curve_fit
 
-default_models = "fit_models.yml"
+# parameters of a single peak: amplitude, centre, width
+peak_parameters = ["amplitude", "centre", "width"]
 
 
-def ensemble(base_function, *param_sets):
-    return(sum([base_function(x, p) for p in param_sets]))
+def ensemble(base_function, x, *param_sets):
+    return(sum([base_function(x, *p) for p in param_sets]))
 
 
 def lorentz(x, *parameters):
+    A, x0, gamma = parameters #gamma is the half width at half maximum
+    return(A/(1. + ((x-x0)/gamma)**2))
 
 
 def gauss(x, *parameters):
     A, mu, sigma = parameters
-    return(A*numpy.exp(-(x-mu)**2/(2.*sigma**2)))
+    return(A*np.exp(-(x-mu)**2/(2.*sigma**2)))
+
+
+models = {"lorentz": lorentz, "gauss": gauss}
+
+
+def multi_peak(base_function, peaks=1):
+    '''model of several peaks of base_function on a constant offset. The
+    parameters are (amplitude, centre, width) of every peak, followed by
+    the offset.'''
+    def model(x, *parameters):
+        sets = [parameters[3*i:3*i + 3] for i in range(peaks)]
+        return(ensemble(base_function, x, *sets) + parameters[-1])
+    return(model)
+
+
+def parameter_names(peaks=1):
+    '''names of the fitted parameters of a multi_peak model'''
+    if peaks == 1:
+        return(peak_parameters + ["offset"])
+    return([name + "_" + str(i + 1) for i in range(peaks)
+            for name in peak_parameters] + ["offset"])
+
+
+def estimate(x, y, peaks=1):
+    '''start values for a multi_peak model: the most prominent maxima of the
+    spectrum on an offset taken from its lower values'''
+    from scipy.signal import find_peaks, peak_widths
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    offset = np.percentile(y, 10)
+    found, properties = find_peaks(y, prominence=0)
+    found = found[np.argsort(properties["prominences"])[::-1][:peaks]]
+    if len(found) < peaks:
+        spare = np.linspace(0, len(x) - 1, peaks + 2)[1:-1].astype(int)
+        found = np.concatenate([found, spare[len(found):]])
+    widths = peak_widths(y, found, rel_height=0.5)[0]
+    step = np.abs(x[-1] - x[0])/max(len(x) - 1, 1)
+    start = []
+    for position, width in zip(found, widths):
+        start += [y[position] - offset, x[position], max(width*step/2, step)]
+    return(start + [offset])
+
+
+def fit_spectrum(function, x, y, start, bounds=None, maxfev=2000):
+    '''least squares fit of function to the spectrum, returns the fitted
+    parameters and the root mean square of the residuals. Raises
+    RuntimeError, if the fit does not converge.'''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if bounds is None:
+        popt, pcov = curve_fit(function, x, y, p0=start, maxfev=maxfev)
+    else:
+        popt, pcov = curve_fit(function, x, y, p0=start, bounds=bounds,
+                               max_nfev=maxfev)
+    residual = np.sqrt(np.mean((function(x, *popt) - y)**2))
+    return(popt, residual)
 
 
 class FitAnalysis:
-    
+    '''Fits a model of one or more peaks (lorentz or gauss) on a constant
+    offset to spectra'''
+
+    def __init__(self,
+                 model="lorentz",
+                 peaks=1):
+        self.set_model(model, peaks)
+        self.parameters = None
+        self.residual = None
+
 
     def load_file(self, source):
+        import yaml
         with open(source, "r") as yaml_file:
-            cfg = yaml.load(yaml_file)
+            cfg = yaml.load(yaml_file, Loader=yaml.SafeLoader)
         return(cfg)
 
-    
-    def phonon_model(self, 
+
+    def phonon_model(self,
                      material="WSe2",
                      layers="Monolayer",
                      source="phonons.yml",):
+        '''theoretical phonon energies [meV] of the material'''
         source = self.load_file(source)
-    
+        return(source[material][layers])
 
-    def exciton(self, 
+
+    def exciton(self,
                 data,
-                energy,
+                energy=None,
                 bounds=None,
                 base_function=lorentz):
-        popt, pcov = curve_fit(base_function, data[0], data[1]
-
-    
-
-    def __init__(self, 
-                 model=None,
-                 model_source=default_models):
+        '''fits a single peak to data = (x, y), starting at the given
+        energy. Returns the parameters and their covariance.'''
+        start = estimate(data[0], data[1])
+        if energy is not None:
+            start[1] = energy
+        popt, pcov = curve_fit(multi_peak(base_function),
+                               data[0],
+                               data[1],
+                               p0=start,
+                               bounds=(-np.inf, np.inf) if bounds is None else bounds)
+        return(popt, pcov)
+
+
+    def fit(self, x, y, start=None):
+        '''fits the model to a spectrum, estimating the start values if none
+        are given'''
+        if start is None:
+            start = estimate(x, y, self.peaks)
+        self.parameters, self.residual = fit_spectrum(self.function, x, y, start)
+        return(self.parameters)
+
+
+    def set_model(self, model="lorentz", peaks=1):
+        if model not in models:
+            raise ValueError("Unknown model " + repr(model)
+                             + ", use one of " + ", ".join(models))
         self.model = model
-        self.startvalues = parameters
-
-
-    def fit(self):
-        self.parameters
-
-
-    def set_model(self, model=None):
-        self.model = model
-
+        self.peaks = peaks
+        self.function = multi_peak(models[model], peaks)
+        self.names = parameter_names(peaks)
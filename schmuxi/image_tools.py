@@ -0,0 +1,129 @@
+'''Image calculations of the map and sweep viewers, kept apart from the
+bokeh scripts so that they can be reused and benchmarked.'''
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+def power_image(z, contrast=1, maximum=None):
+    '''normalizes an image (to its largest magnitude or the given maximum)
+    and maps it on a power-law. The sign of differential images is kept.'''
+    z = z/(np.max(np.abs(z)) if maximum is None else maximum)
+    z = np.sign(z)*np.power(np.abs(z), contrast)
+    return(z)
+
+
+def layer_image(z):
+    '''scales a parameter map to 0..1 between its smallest and largest
+    finite value. Skipped pixels (NaN) stay NaN.'''
+    z = np.asarray(z, dtype=float)
+    finite = z[np.isfinite(z)]
+    if len(finite) == 0:
+        return(z)
+    low, high = np.min(finite), np.max(finite)
+    return((z - low)/(high - low if high > low else 1.))
+
+
+def reference_key(reference):
+    '''identifies a reference spectrum by its values'''
+    reference = np.ascontiguousarray(reference, dtype=float)
+    return(hashlib.sha1(reference.tobytes()).hexdigest())
+
+
+def map_differential(spectra, reference):
+    '''differential reflectance (reference - R)/reference of spectra along
+    the last axis. Channels without reference signal are 0.'''
+    reference = np.asarray(reference, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        differential = (reference - spectra)/reference
+    return(np.where(reference != 0, differential, 0.))
+
+
+def sweep_differential(sweep, background, offset=0.1):
+    '''differential signal (z - background)/(z + background + offset) of
+    every spectrum of a sweep'''
+    return((sweep - background)/(sweep + background + offset))
+
+
+class ReferenceCache:
+    '''Keeps the results of function(data, reference) for the last few
+    references, so that the data is only normalized once per reference.
+    The data is expected to stay the same. evict is called with every
+    result, that is dropped, e.g. to remove its files.'''
+
+    def __init__(self, function, size=4, evict=None):
+        self.function = function
+        self.size = size
+        self.evict = evict
+        self.results = OrderedDict()
+
+
+    def __call__(self, data, reference):
+        key = reference_key(reference)
+        if key in self.results:
+            self.results.move_to_end(key)
+            return(self.results[key])
+        result = self.function(data, reference)
+        self.results[key] = result
+        while len(self.results) > self.size:
+            self.drop(next(iter(self.results)))
+        return(result)
+
+
+    def drop(self, key):
+        result = self.results.pop(key)
+        if self.evict is not None:
+            self.evict(result)
+
+
+    def clear(self):
+        '''drops all results'''
+        for key in list(self.results):
+            self.drop(key)
+
+
+def downsample(z):
+    '''halves an image by averaging blocks of 2x2 pixels. At odd edges only
+    the remaining pixels are averaged.'''
+    x, y = np.shape(z)
+    padded = np.full((x + x%2, y + y%2), np.nan)
+    padded[:x, :y] = z
+    blocks = padded.reshape(padded.shape[0]//2, 2, padded.shape[1]//2, 2)
+    return(np.nanmean(blocks, axis=(1, 3)))
+
+
+def pyramid(z, size=128):
+    '''image pyramid: the image followed by downsampled versions, each half
+    the size of the one before, down to about size pixels'''
+    levels = [np.asarray(z, dtype=float)]
+    while max(levels[-1].shape) > size:
+        levels.append(downsample(levels[-1]))
+    return(levels)
+
+
+def pyramid_level(levels, visible, screen):
+    '''coarsest level of the pyramid, that still has about one image pixel
+    per screen pixel, when visible pixels of the full image are shown on
+    screen pixels'''
+    level = int(np.floor(np.log2(max(visible/float(screen), 1))))
+    return(min(level, len(levels) - 1))
+
+
+def integrated_image(data3d, contrast=1):
+    '''integrates a map over its spectral axis, normalizes it and maps it on
+    a power-law'''
+    return(power_image(np.sum(data3d, axis=2), contrast))
+
+
+def sweep_contrast(sweep, threshold, contrast, background=None):
+    '''adjusts the contrast of a sweep by clipping values above threshold
+    times the median and mapping the rest on a power-law. With a background
+    the differential signal (z - background)/(z + background) is shown.'''
+    z = sweep
+    if background is not None:
+        z = sweep_differential(z, background)
+
+    z = np.clip(z, 0, np.median(z)*threshold)
+    z = z/(np.max(z) + 0.02)
+    z = np.power(z, contrast)
+    return(z)
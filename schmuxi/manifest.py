@@ -0,0 +1,72 @@
+'''Bookkeeping of the outputs in the working directory.
+
+The manifest is a json-file in working_dir, that records for every output
+(cleaned spectrum, csv-export, png) the fingerprints of its input files and a
+hash of the configuration it was created with. Outputs are only created
+again, if one of those has changed.'''
+import os
+import json
+import hashlib
+
+manifest_name = ".schmuxi_manifest.json"
+
+
+def fingerprint(path):
+    '''identifies the state of a file by its size and modification time'''
+    stat = os.stat(path)
+    return(str(stat.st_size) + ":" + str(stat.st_mtime_ns))
+
+
+def settings_hash(settings):
+    '''hash of a (nested) dictionary of settings'''
+    dump = json.dumps(settings, sort_keys=True, default=str)
+    return(hashlib.sha1(dump.encode()).hexdigest())
+
+
+class Manifest:
+    '''Records, which inputs and settings every output was created from'''
+
+    def __init__(self, working_dir, force=False):
+        self.path = os.path.join(working_dir, manifest_name)
+        self.working_dir = working_dir
+        self.force = force
+        try:
+            with open(self.path, 'r') as manifest_file:
+                self.entries = json.load(manifest_file)
+        except (IOError, ValueError):
+            self.entries = dict()
+
+
+    def inputs(self, files):
+        '''fingerprints of all given input files'''
+        return({os.path.abspath(path): fingerprint(path) for path in files})
+
+
+    def is_current(self, output, files, settings):
+        '''True, if the output exists and was created from the same inputs
+        and settings'''
+        if self.force is True:
+            return(False)
+        if not os.path.exists(os.path.join(self.working_dir, output)):
+            return(False)
+        entry = self.entries.get(output)
+        if entry is None or entry["settings"] != settings:
+            return(False)
+        try:
+            return(entry["inputs"] == self.inputs(files))
+        except OSError:
+            return(False)
+
+
+    def record(self, output, files, settings):
+        '''marks the output as created from the given inputs and settings'''
+        self.entries[output] = {"inputs": self.inputs(files),
+                                "settings": settings}
+
+
+    def save(self):
+        '''writes the manifest atomically into the working directory'''
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as manifest_file:
+            json.dump(self.entries, manifest_file, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
@@ -0,0 +1,309 @@
+'''Out-of-core storage of spectral maps.
+
+A map is converted once into a directory in working_dir, that holds the cube
+as a memory mappable .npy-file of shape (x, y, channels), its calibration and
+a json-file describing the source it was created from:
+
+.schmuxi_maps/
+    map.txt.cube/
+        cube.npy            float32, the spectrum of every pixel is contiguous
+        calibration.npy
+        meta.json
+        prefix.npy          cumulative sums along the channels, created on demand
+        differential-.../   cube of the differential reflectance for a reference,
+                            with a prefix.npy of its own
+
+The viewers open the cube as a memory map: a pixel spectrum is a single
+small read and images are reduced in chunks of rows, so the memory needed
+stays far below the size of the cube. The cube is converted again, as soon
+as the source file or the background changes.
+
+The prefix index holds the cumulative sums of every pixel spectrum, stored
+channel by channel: prefix[c] is the image integrated over the channels
+below c. The image of any band is then the difference of two contiguous
+planes, prefix[stop] - prefix[start], without touching the cube.
+
+Disk usage: the prefix index of a map is float64, as the sums of raw counts
+need the precision, and takes about twice the size of the float32 cube.
+A differential cube takes the size of the map cube, its prefix index about
+the same again, as the ratios are summed well within float32. Only the
+differential cubes of the last kept_differentials references are kept,
+older ones are deleted from disk together with their prefix index.'''
+import os
+import json
+import shutil
+from glob import glob
+import numpy as np
+from manifest import fingerprint
+from telemetry import timed
+from image_tools import power_image, reference_key, map_differential
+from image_tools import ReferenceCache
+
+default_directory = ".schmuxi_maps"
+# pixels converted or reduced at once
+chunk_pixels = 4096
+# differential cubes kept per map, each about twice the size of the map cube
+kept_differentials = 4
+
+
+class MapCube:
+    '''Memory mapped spectral map of shape (dim_x, dim_y, channels)'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+        self.cube = np.load(os.path.join(directory, "cube.npy"),
+                            mmap_mode='r',
+                            allow_pickle=False)
+        self.calibration = np.load(os.path.join(directory, "calibration.npy"))
+        self.dim_x, self.dim_y, self.channels = self.cube.shape
+        self.prefix = None
+        self.prefix_dtype = self.meta.get("prefix_dtype", "float64")
+        self.differentials = ReferenceCache(differential_cube,
+                                            kept_differentials,
+                                            evict=remove_cube)
+
+
+    def spectrum(self, x, y):
+        '''spectrum of a single pixel'''
+        return(np.array(self.cube[x, y], dtype=float))
+
+
+    def rows(self):
+        '''yields slices of rows, that hold about chunk_pixels pixels'''
+        step = max(1, chunk_pixels//self.dim_y)
+        for start in range(0, self.dim_x, step):
+            yield(slice(start, min(start + step, self.dim_x)))
+
+
+    def band_sum(self, band=None):
+        '''image of the intensities summed over the channels of the band
+        (start, stop), all channels by default'''
+        channels = slice(None) if band is None else slice(*band)
+        image = np.empty((self.dim_x, self.dim_y))
+        for rows in self.rows():
+            image[rows] = np.sum(self.cube[rows, :, channels], axis=2,
+                                 dtype=float)
+        return(image)
+
+
+    def integrated_image(self, contrast=1, band=None):
+        '''same as image_tools.integrated_image, computed chunk by chunk'''
+        return(power_image(self.band_sum(band), contrast))
+
+
+    def prefix_index(self):
+        '''opens the prefix index, building it on first use'''
+        if self.prefix is not None:
+            return(self.prefix)
+        path = os.path.join(self.directory, "prefix.npy")
+        try:
+            self.prefix = np.load(path, mmap_mode='r', allow_pickle=False)
+        except (IOError, ValueError):
+            self.prefix = None
+        if (self.prefix is None
+                or self.prefix.shape != (self.channels + 1,
+                                         self.dim_x,
+                                         self.dim_y)
+                or self.prefix.dtype != self.prefix_dtype):
+            self.prefix = build_prefix(self.cube, path, self.prefix_dtype)
+        return(self.prefix)
+
+
+    def differential(self, reference):
+        '''cube of the differential reflectance (reference - R)/reference,
+        computed once per reference spectrum and kept next to the cube. The
+        cubes of the last kept_differentials references are kept, older
+        ones are deleted.'''
+        return(self.differentials(self, reference))
+
+
+    def band_image(self, start=0, stop=None):
+        '''image integrated over the channels start to stop (excluded),
+        taken from the prefix index'''
+        prefix = self.prefix_index()
+        stop = self.channels if stop is None else stop
+        return(prefix[stop] - prefix[start])
+
+
+def channel_band(axis, low, high):
+    '''(start, stop) of the channels, whose axis values lie between low and
+    high. The axis has to be monotonic.'''
+    inside = np.flatnonzero((axis >= min(low, high)) & (axis <= max(low, high)))
+    if len(inside) == 0:
+        return(0, 0)
+    return(inside[0], inside[-1] + 1)
+
+
+@timed("build_prefix_index")
+def build_prefix(cube, path, dtype="float64"):
+    '''writes the cumulative sums of all pixel spectra, transposed to
+    (channels + 1, x, y), chunk by chunk into a memory mapped file. The sums
+    are taken in float64 and stored as dtype.'''
+    dim_x, dim_y, channels = cube.shape
+    temporary = path + '.' + str(os.getpid()) + '.tmp'
+    prefix = np.lib.format.open_memmap(temporary,
+                                       mode='w+',
+                                       dtype=dtype,
+                                       shape=(channels + 1, dim_x, dim_y))
+    prefix[0] = 0
+    step = max(1, chunk_pixels//dim_y)
+    for start in range(0, dim_x, step):
+        rows = slice(start, min(start + step, dim_x))
+        cumulative = np.cumsum(cube[rows], axis=2, dtype=float)
+        prefix[1:, rows, :] = np.moveaxis(cumulative, 2, 0)
+    prefix.flush()
+    del prefix
+    os.replace(temporary, path)
+    return(np.load(path, mmap_mode='r', allow_pickle=False))
+
+
+def differential_cube(cube, reference):
+    '''opens the differential cube of the MapCube for the reference,
+    building it first if necessary. Differential cubes left over beyond
+    kept_differentials are deleted, the least recently used first.'''
+    key = reference_key(reference)
+    target = os.path.join(cube.directory, "differential-" + key[:16])
+    source = {"cube": cube.meta["source"], "reference": key}
+    differential = open_cube(target, source)
+    if differential is None:
+        differential = build_differential(cube, reference, target, source)
+    os.utime(target)
+    used = sorted(glob(os.path.join(cube.directory, "differential-*")),
+                  key=os.path.getmtime)
+    for outdated in used[:-kept_differentials]:
+        shutil.rmtree(outdated, ignore_errors=True)
+    return(differential)
+
+
+def remove_cube(cube):
+    '''deletes the directory of a cube, that is no longer used'''
+    shutil.rmtree(cube.directory, ignore_errors=True)
+
+
+@timed("build_differential")
+def build_differential(cube, reference, target, source):
+    '''writes the differential reflectance of all pixels, chunk by chunk.
+    Its prefix index is stored as float32.'''
+    reference = np.asarray(reference, dtype=float)
+    pixels = cube.cube.reshape(-1, cube.channels)
+    blocks = ((start, map_differential(pixels[start:start + chunk_pixels],
+                                       reference))
+              for start in range(0, len(pixels), chunk_pixels))
+    return(write_cube(target, cube.cube.shape, cube.calibration, blocks,
+                      source, prefix_dtype="float32"))
+
+
+def cube_directory(path, directory=default_directory):
+    '''directory of the cube converted from path'''
+    return(os.path.join(directory, os.path.basename(path) + '.cube'))
+
+
+def source_description(path, **settings):
+    '''identifies the source file and the settings of a conversion'''
+    return(dict(settings, path=os.path.abspath(path),
+                fingerprint=fingerprint(path)))
+
+
+def open_cube(target, source):
+    '''opens the cube in target, if it was converted from source.
+    Returns None otherwise.'''
+    try:
+        cube = MapCube(target)
+    except (IOError, ValueError):
+        return(None)
+    if cube.meta.get("source") != source:
+        return(None)
+    return(cube)
+
+
+def create_cube(target, shape, dtype="float32"):
+    '''removes the meta data of an outdated cube in target and returns a
+    new, writable memory map of the given shape'''
+    os.makedirs(target, exist_ok=True)
+    for outdated in ["meta.json", "prefix.npy"]:
+        if os.path.exists(os.path.join(target, outdated)):
+            os.remove(os.path.join(target, outdated))
+    return(np.lib.format.open_memmap(os.path.join(target, "cube.npy"),
+                                     mode='w+',
+                                     dtype=dtype,
+                                     shape=tuple(shape)))
+
+
+def finish_cube(target, cube, calibration, source, prefix_dtype="float64"):
+    '''flushes the filled memory map and writes calibration and meta.json.
+    meta.json is written last, so an interrupted conversion is never taken
+    for a complete cube. prefix_dtype is the type of its prefix index.'''
+    shape, dtype = list(cube.shape), str(cube.dtype)
+    cube.flush()
+    del cube
+    np.save(os.path.join(target, "calibration.npy"),
+            np.asarray(calibration, dtype=float))
+    meta_path = os.path.join(target, "meta.json")
+    with open(meta_path + '.tmp', 'w') as meta_file:
+        json.dump({"source": source, "shape": shape, "dtype": dtype,
+                   "prefix_dtype": prefix_dtype},
+                  meta_file, indent=1)
+    os.replace(meta_path + '.tmp', meta_path)
+    return(MapCube(target))
+
+
+def write_cube(target, shape, calibration, blocks, source, dtype="float32",
+               prefix_dtype="float64"):
+    '''writes a cube from blocks of (first pixel, pixel spectra) in the
+    order of the flattened (x, y) pixels'''
+    cube = create_cube(target, shape, dtype)
+    pixels = cube.reshape(-1, shape[2])
+    for start, block in blocks:
+        pixels[start:start + len(block)] = block
+    del pixels
+    return(finish_cube(target, cube, calibration, source, prefix_dtype))
+
+
+@timed("convert_labview_map")
+def labview_cube(path, dimensions, background=0,
+                 directory=default_directory):
+    '''opens the cube of a LabVIEW text map (6 header rows, then one row per
+    channel with the calibration and the spectra of all pixels), converting
+    it first if necessary. The text is parsed chunk by chunk straight into
+    the memory map.'''
+    target = cube_directory(path, directory)
+    source = source_description(path, dimensions=dimensions,
+                                background=background)
+    cube = open_cube(target, source)
+    if cube is not None:
+        return(cube)
+
+    from map_io import labview_channels, stream_labview_map
+    cube = create_cube(target,
+                       (dimensions, dimensions, labview_channels(path)))
+    cube, calibration = stream_labview_map(path, dimensions, cube, background)
+    return(finish_cube(target, cube, calibration, source))
+
+
+@timed("convert_mat_map")
+def mat_cube(path, calibration_path, background=0,
+             directory=default_directory):
+    '''opens the cube of a .mat map, converting it first if necessary. The
+    calibration is read from the file or from calibration_path.'''
+    target = cube_directory(path, directory)
+    source = source_description(path, background=background)
+    cube = open_cube(target, source)
+    if cube is not None:
+        return(cube)
+
+    import scipy.io as sio
+    from compressed import open_input
+    from map_io import read_column
+    with open_input(path, 'rb') as mat_file:
+        mat = sio.loadmat(mat_file)
+    spectra = mat['spectra']
+    try:
+        calibration = mat['wlen_to_px'][0,0]
+    except KeyError:
+        calibration = read_column(calibration_path)
+    flat = spectra.reshape(-1, spectra.shape[2])
+    blocks = ((start, flat[start:start + chunk_pixels] - background)
+              for start in range(0, len(flat), chunk_pixels))
+    return(write_cube(target, spectra.shape, calibration, blocks, source))
@@ -0,0 +1,213 @@
+'''Decomposition of map cubes into component spectra and abundance maps.
+
+The cube is seen as a (pixels x channels) matrix of the channels within an
+energy window. Both methods only read the cube chunk by chunk of rows, so
+they work on memory mapped cubes of any size; what stays in memory are the
+abundances (pixels x components) and a few (channels x components) arrays.
+
+pca: randomized SVD of the mean-centred matrix. The row space is found by
+     power iterations X^T (X Q), each a single pass over the cube, then the
+     projection onto it is decomposed exactly.
+nmf: non-negative matrix factorisation X ~ W H by multiplicative updates.
+     Every iteration updates the abundances W chunk by chunk and collects
+     what the update of the component spectra H needs in the same pass.
+
+Results are kept next to the cube, once per method, window and number of
+components:
+
+.schmuxi_maps/
+    map.txt.cube/
+        decomposition-.../
+            components.npy      (components, channels of the window)
+            abundances.npy      (components, x, y)
+            meta.json'''
+import os
+import json
+import hashlib
+import numpy as np
+from telemetry import timed
+
+methods = ["pca", "nmf"]
+
+
+class Decomposition:
+    '''Component spectra and abundance maps of a cube within the channels
+    band = (start, stop). score is the explained variance ratio of every
+    component (pca) or the relative residual of the factorisation (nmf).'''
+
+    def __init__(self, method, band, components, abundances, score):
+        self.method = method
+        self.band = tuple(band)
+        self.components = components
+        self.abundances = abundances
+        self.score = score
+
+
+    def maps(self):
+        '''abundance maps as name -> (dim_x, dim_y) array'''
+        return({self.method + "_" + str(i + 1): abundance
+                for i, abundance in enumerate(self.abundances)})
+
+
+def chunks(cube, band):
+    '''yields (first pixel, pixel spectra) of the channels in band, chunk by
+    chunk of rows'''
+    for rows in cube.rows():
+        block = np.array(cube.cube[rows, :, band[0]:band[1]], dtype=float)
+        yield(rows.start*cube.dim_y, block.reshape(-1, band[1] - band[0]))
+
+
+def pca(cube, components=3, band=None, oversampling=10, power_iterations=2,
+        seed=0):
+    '''randomized principal component analysis of the pixel spectra.
+    Returns the components (components, channels), the scores (pixels,
+    components) and the explained variance ratio of every component.'''
+    band = (0, cube.channels) if band is None else band
+    channels = band[1] - band[0]
+    pixels = cube.dim_x*cube.dim_y
+    rank = min(components + oversampling, channels, pixels)
+
+    mean = np.zeros(channels)
+    total = 0.
+    for start, block in chunks(cube, band):
+        mean += np.sum(block, axis=0)
+        total += np.sum(block**2)
+    mean /= pixels
+    total -= pixels*np.sum(mean**2)
+
+    random = np.random.RandomState(seed)
+    basis = random.standard_normal((channels, rank))
+    for i in range(power_iterations + 1):
+        gathered = np.zeros((channels, rank))
+        for start, block in chunks(cube, band):
+            block -= mean
+            gathered += np.dot(block.T, np.dot(block, basis))
+        basis = np.linalg.qr(gathered)[0]
+
+    projection = np.empty((pixels, rank))
+    for start, block in chunks(cube, band):
+        projection[start:start + len(block)] = np.dot(block - mean, basis)
+    left, singular, right = np.linalg.svd(projection, full_matrices=False)
+    spectra = np.dot(basis, right.T).T[:components]
+    scores = (left*singular)[:, :components]
+    # the sign of a component is arbitrary, its largest value is made positive
+    signs = np.sign(spectra[np.arange(len(spectra)),
+                            np.argmax(np.abs(spectra), axis=1)])
+    signs[signs == 0] = 1
+    explained = singular[:components]**2/max(total, np.finfo(float).tiny)
+    return(spectra*signs[:, None], scores*signs, explained)
+
+
+def nmf(cube, components=3, band=None, iterations=200, tolerance=1e-4,
+        seed=0):
+    '''non-negative matrix factorisation of the pixel spectra (negative
+    values are taken as 0). Returns the component spectra (components,
+    channels), scaled to a maximum of 1, the abundances (pixels, components)
+    and the relative residual.'''
+    band = (0, cube.channels) if band is None else band
+    channels = band[1] - band[0]
+    pixels = cube.dim_x*cube.dim_y
+    epsilon = 1e-12
+
+    total = 0.
+    level = 0.
+    for start, block in chunks(cube, band):
+        block = np.maximum(block, 0)
+        total += np.sum(block**2)
+        level += np.sum(block)
+    scale = np.sqrt(level/(pixels*channels)/components)
+    random = np.random.RandomState(seed)
+    abundances = scale*random.random_sample((pixels, components))
+    spectra = scale*random.random_sample((components, channels))
+
+    residual = np.inf
+    for i in range(iterations):
+        gram = np.dot(spectra, spectra.T)
+        numerator = np.zeros((components, channels))
+        products = np.zeros((components, components))
+        for start, block in chunks(cube, band):
+            block = np.maximum(block, 0)
+            weights = abundances[start:start + len(block)]
+            weights *= np.dot(block, spectra.T)/(np.dot(weights, gram)
+                                                 + epsilon)
+            numerator += np.dot(weights.T, block)
+            products += np.dot(weights.T, weights)
+        # |X - W H|^2 of the new abundances and the former spectra
+        error = (total - 2*np.sum(numerator*spectra)
+                 + np.sum(np.dot(products, spectra)*spectra))
+        spectra *= numerator/(np.dot(products, spectra) + epsilon)
+        previous = residual
+        residual = np.sqrt(max(error, 0)/total) if total > 0 else 0.
+        if previous - residual < tolerance*residual:
+            break
+
+    maximum = np.max(spectra, axis=1)
+    maximum[maximum == 0] = 1
+    spectra /= maximum[:, None]
+    abundances *= maximum
+    order = np.argsort(np.sum(abundances, axis=0))[::-1]
+    return(spectra[order], abundances[:, order], residual)
+
+
+def decomposition_key(cube, method, components, band, settings):
+    '''identifies a decomposition by the cube and its settings'''
+    description = json.dumps({"source": cube.meta["source"],
+                              "method": method,
+                              "components": components,
+                              "band": list(band),
+                              "settings": settings}, sort_keys=True)
+    return(hashlib.sha1(description.encode()).hexdigest())
+
+
+def load_decomposition(target):
+    '''decomposition stored in target, None if there is none'''
+    try:
+        with open(os.path.join(target, "meta.json"), 'r') as meta_file:
+            meta = json.load(meta_file)
+        return(Decomposition(meta["method"],
+                             meta["band"],
+                             np.load(os.path.join(target, "components.npy")),
+                             np.load(os.path.join(target, "abundances.npy")),
+                             np.asarray(meta["score"])))
+    except (IOError, ValueError, KeyError):
+        return(None)
+
+
+def save_decomposition(target, decomposition, key):
+    '''writes the decomposition, meta.json last'''
+    os.makedirs(target, exist_ok=True)
+    np.save(os.path.join(target, "components.npy"), decomposition.components)
+    np.save(os.path.join(target, "abundances.npy"), decomposition.abundances)
+    meta_path = os.path.join(target, "meta.json")
+    with open(meta_path + '.tmp', 'w') as meta_file:
+        json.dump({"method": decomposition.method,
+                   "band": [int(b) for b in decomposition.band],
+                   "score": np.atleast_1d(decomposition.score).tolist(),
+                   "key": key}, meta_file, indent=1)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+@timed("decompose_map")
+def decompose(cube, method="pca", components=3, band=None, **settings):
+    '''decomposes the MapCube within the channels band = (start, stop), all
+    channels by default, into component spectra and abundance maps.
+    settings are passed on to pca or nmf. The result is cached next to the
+    cube.'''
+    if method not in methods:
+        raise ValueError("Unknown method " + repr(method)
+                         + ", use one of " + ", ".join(methods))
+    band = (0, cube.channels) if band is None else tuple(int(b) for b in band)
+    if band[1] - band[0] < components:
+        raise ValueError("The band has less channels than components")
+    key = decomposition_key(cube, method, components, band, settings)
+    target = os.path.join(cube.directory, "decomposition-" + key[:16])
+    decomposition = load_decomposition(target)
+    if decomposition is not None:
+        return(decomposition)
+
+    function = pca if method == "pca" else nmf
+    spectra, abundances, score = function(cube, components, band, **settings)
+    abundances = abundances.T.reshape(-1, cube.dim_x, cube.dim_y)
+    decomposition = Decomposition(method, band, spectra, abundances, score)
+    save_decomposition(target, decomposition, key)
+    return(decomposition)
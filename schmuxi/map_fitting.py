@@ -0,0 +1,195 @@
+'''Peak fitting of every pixel of a map cube.
+
+A model of one or more peaks (see fit_analysis) is fitted to the spectrum of
+every pixel within a band of channels. The map is split into strips of rows,
+that are fitted by a pool of processes. Each process opens the memory mapped
+cube itself and walks its strip in a serpentine, so that every fit starts
+from the parameters of the neighbour fitted before (and falls back to
+estimated start values, if that fails). Pixels outside the mask or darker
+than a fraction of the brightest pixel are skipped and stay NaN.
+
+The results are parameter maps (amplitude, centre, width, offset and the
+rms of the residuals), stored next to the cube, so that a fit is only run
+once per model, band and mask:
+
+.schmuxi_maps/
+    map.txt.cube/
+        fit-.../
+            amplitude.npy
+            centre.npy
+            ...
+            meta.json'''
+import os
+import json
+import hashlib
+import warnings
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import OptimizeWarning
+from telemetry import timed
+from image_tools import reference_key
+from fit_analysis import models, multi_peak, parameter_names, estimate
+from fit_analysis import fit_spectrum
+
+# rows of the map fitted by a single task
+strip_rows = 4
+
+
+def fit_strip(directory, x, band, model, peaks, rows, mask):
+    '''fits all pixels of the given rows of the cube in directory, where
+    mask is True. Returns the parameters and residual of every pixel.'''
+    from map_cube import MapCube
+    cube = MapCube(directory)
+    function = multi_peak(models[model], peaks)
+    count = 3*peaks + 1
+    results = np.full((len(rows), cube.dim_y, count + 1), np.nan)
+    start = None
+    with warnings.catch_warnings():
+        # the covariance is not needed
+        warnings.simplefilter("ignore", OptimizeWarning)
+        for i, row in enumerate(rows):
+            spectra = np.asarray(cube.cube[row, :, band[0]:band[1]],
+                                 dtype=float)
+            columns = range(cube.dim_y)
+            for column in columns if i%2 == 0 else reversed(columns):
+                if not mask[i, column]:
+                    continue
+                guesses = [estimate(x, spectra[column], peaks)]
+                if start is not None:
+                    guesses.insert(0, start)
+                for guess in guesses:
+                    try:
+                        popt, residual = fit_spectrum(function, x,
+                                                      spectra[column], guess)
+                    except (RuntimeError, ValueError):
+                        continue
+                    if plausible(popt, x, peaks):
+                        results[i, column, :count] = popt
+                        results[i, column, count] = residual
+                        start = popt
+                        break
+                else:
+                    start = None
+    return(results)
+
+
+def plausible(parameters, x, peaks):
+    '''True, if all peaks of a fit lie within the band and are narrower
+    than it'''
+    if not np.all(np.isfinite(parameters)):
+        return(False)
+    span = np.max(x) - np.min(x)
+    centres = np.asarray(parameters[1:3*peaks:3])
+    widths = np.abs(parameters[2:3*peaks:3])
+    return(bool(np.all((centres >= np.min(x)) & (centres <= np.max(x))
+                       & (widths < span))))
+
+
+def fit_key(cube, x, band, model, peaks, mask, dark):
+    '''identifies a fit by its settings, so that it is found without
+    reading the cube'''
+    settings = json.dumps({"source": cube.meta["source"], "band": list(band),
+                           "model": model, "peaks": peaks, "dark": dark},
+                          sort_keys=True)
+    digest = hashlib.sha1(settings.encode())
+    digest.update(reference_key(x).encode())
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        digest.update(str(mask.shape).encode())
+        digest.update(np.packbits(mask).tobytes())
+    return(digest.hexdigest())
+
+
+def peak_signal(cube, band):
+    '''image of the largest deviation of every pixel spectrum from its
+    median within the band, so that a constant offset does not count'''
+    image = np.empty((cube.dim_x, cube.dim_y))
+    for rows in cube.rows():
+        spectra = np.asarray(cube.cube[rows, :, band[0]:band[1]], dtype=float)
+        image[rows] = np.max(np.abs(spectra - np.median(spectra, axis=2,
+                                                         keepdims=True)),
+                             axis=2)
+    return(image)
+
+
+def fit_mask(cube, band, mask=None, dark=0.2):
+    '''pixels to fit: inside the mask and with a peak signal (in the band)
+    of at least dark times that of the brightest pixel'''
+    selected = np.ones((cube.dim_x, cube.dim_y), dtype=bool)
+    if mask is not None:
+        selected &= np.asarray(mask, dtype=bool)
+    if dark:
+        signal = peak_signal(cube, band)
+        selected &= signal >= dark*np.max(signal)
+    return(selected)
+
+
+def load_fit(target):
+    '''parameter maps of a finished fit in target, None if there is none'''
+    try:
+        with open(os.path.join(target, "meta.json"), 'r') as meta_file:
+            meta = json.load(meta_file)
+        return({name: np.load(os.path.join(target, name + ".npy"),
+                              allow_pickle=False)
+                for name in meta["maps"]})
+    except (IOError, ValueError, KeyError):
+        return(None)
+
+
+def save_fit(target, maps, settings):
+    '''writes the parameter maps, meta.json last'''
+    os.makedirs(target, exist_ok=True)
+    for name, values in maps.items():
+        np.save(os.path.join(target, name + ".npy"), values)
+    meta_path = os.path.join(target, "meta.json")
+    with open(meta_path + '.tmp', 'w') as meta_file:
+        json.dump(dict(settings, maps=list(maps)), meta_file, indent=1)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+@timed("fit_map")
+def fit_map(cube, x, model="lorentz", peaks=1, band=None, mask=None,
+            dark=0.2, workers=None):
+    '''fits the model to every pixel of the MapCube within the band of
+    channels (start, stop), x being the axis of all channels. Returns the
+    parameter maps as name -> (dim_x, dim_y) array, NaN where a pixel was
+    skipped or its fit failed (so the residual map tells, which pixels were
+    fitted). workers=1 fits in this process.'''
+    if model not in models:
+        raise ValueError("Unknown model " + repr(model)
+                         + ", use one of " + ", ".join(models))
+    band = (0, cube.channels) if band is None else tuple(int(b) for b in band)
+    x = np.asarray(x, dtype=float)[band[0]:band[1]]
+    if len(x) < 3*peaks + 1:
+        raise ValueError("The band has less channels than the model has"
+                         + " parameters")
+    key = fit_key(cube, x, band, model, peaks, mask, dark)
+    target = os.path.join(cube.directory, "fit-" + key[:16])
+    maps = load_fit(target)
+    if maps is not None:
+        return(maps)
+
+    selected = fit_mask(cube, band, mask, dark)
+
+    strips = [list(range(start, min(start + strip_rows, cube.dim_x)))
+              for start in range(0, cube.dim_x, strip_rows)]
+    fit = partial(fit_strip, os.path.abspath(cube.directory), x, band, model,
+                  peaks)
+    masks = [selected[rows] for rows in strips]
+    if workers == 1 or len(strips) < 2:
+        results = [fit(rows, strip_mask)
+                   for rows, strip_mask in zip(strips, masks)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(fit, strips, masks))
+    results = np.concatenate(results)
+
+    names = parameter_names(peaks) + ["residual"]
+    maps = {name: results[:, :, i] for i, name in enumerate(names)}
+    for name in maps:
+        if name.startswith("width"):
+            maps[name] = np.abs(maps[name])
+    save_fit(target, maps, {"model": model, "peaks": peaks,
+                            "band": list(band), "key": key})
+    return(maps)
@@ -0,0 +1,165 @@
+'''Loaders for spectral maps and sweeps, used by evaluate_map.py and
+evaluate_sweep.py. All loaders accept an optional SpectrumCache, that keeps
+the parsed arrays between sessions. Compressed files (.gz, .xz, ...) are
+decompressed while they are parsed.'''
+import numpy as np
+import pandas as pd
+from telemetry import timed
+from compressed import open_input
+
+# values of a text map parsed at once
+chunk_values = 2**20
+# bytes read at once while counting lines
+chunk_size = 4*1024**2
+# rows of a LabVIEW text map before the first channel
+labview_header = 6
+
+
+def fetch(path, loader, cache=None, tag=''):
+    '''loads an array through the cache, if one is given'''
+    if cache is None:
+        return(np.asarray(loader(path)))
+    return(cache.fetch(path, loader, tag))
+
+
+def read_column(path, seperator='\t'):
+    '''reads the first column of a headerless csv-file'''
+    with open_input(path, 'rb') as column_file:
+        return(pd.read_csv(column_file, sep=seperator, header=None)[0].values)
+
+
+def read_table(path, seperator='\t'):
+    '''reads a csv-file with header into an array'''
+    with open_input(path, 'rb') as table_file:
+        return(pd.read_csv(table_file, sep=seperator).values)
+
+
+def read_text(path):
+    '''reads a whitespace separated text file into an array'''
+    with open_input(path, 'rt') as text_file:
+        return(np.loadtxt(text_file))
+
+
+def count_rows(path, chunk_size=chunk_size):
+    '''number of lines of a text file, without trailing empty lines'''
+    rows = 0
+    tail = b""
+    with open_input(path, 'rb') as text_file:
+        while True:
+            chunk = text_file.read(chunk_size)
+            if not chunk:
+                break
+            rows += chunk.count(b"\n")
+            tail = (tail + chunk)[-4096:]
+    content = tail.rstrip()
+    if not content:
+        return(0)
+    # the last line with content may miss its line break
+    return(rows - tail[len(content):].count(b"\n") + 1)
+
+
+def labview_channels(path, header=labview_header):
+    '''number of channels (rows after the header) of a LabVIEW text map'''
+    return(count_rows(path) - header)
+
+
+def stream_labview_map(path, dimensions, out=None, background=0,
+                       header=labview_header, chunk_values=chunk_values):
+    '''parses a LabVIEW text map block by block of rows and writes the
+    spectra straight into out, an array (or memory map) of shape
+    (dimensions, dimensions, channels), which is allocated if None. Only
+    about chunk_values parsed values are held in memory besides out.
+    Returns out and the calibration.'''
+    columns = 1 + dimensions*dimensions
+    if out is None:
+        out = np.empty((dimensions, dimensions,
+                        labview_channels(path, header)))
+    channels = out.shape[2]
+    pixels = out.reshape(-1, channels)
+    calibration = np.empty(channels)
+    background = np.asarray(background, dtype=float)
+    step = max(1, chunk_values//columns)
+    with open_input(path, 'rt') as map_file:
+        for row in range(0, channels, step):
+            block = np.loadtxt(map_file,
+                               skiprows=header if row == 0 else 0,
+                               max_rows=min(step, channels - row),
+                               ndmin=2)
+            stop = row + len(block)
+            if stop == row or block.shape[1] != columns:
+                raise ValueError(path + ": expected " + str(channels)
+                                 + " rows of " + str(columns) + " columns"
+                                 + " after the header, failed at channel "
+                                 + str(row))
+            offset = background[row:stop] if background.ndim else background
+            calibration[row:stop] = block[:, 0]
+            pixels[:, row:stop] = block[:, 1:].T - offset
+    return(out, calibration)
+
+
+@timed("labview_map")
+def load_labview_map(path, dimensions, background=0, cache=None):
+    '''Loads a LabVIEW text map: 6 header rows, followed by the calibration
+    column and dimensions^2 columns of spectra. The file is parsed chunk by
+    chunk into the preallocated cube.'''
+    parsed = dict()
+
+    def read(tag):
+        if not parsed:
+            parsed["cube"], parsed["calibration"] = stream_labview_map(
+                                                            path, dimensions)
+        return(parsed[tag])
+
+    tag = 'labview%d_' % dimensions
+    data3d = fetch(path, lambda path: read("cube"), cache, tag + 'cube')
+    calibration = fetch(path, lambda path: read("calibration"), cache,
+                        tag + 'calibration')
+    if np.any(background):
+        data3d -= background
+    return(data3d, calibration, dimensions, dimensions)
+
+
+@timed("mat_map")
+def load_mat_map(path, calibration_path, background=0, cache=None):
+    '''Loads a .mat file that describes a spectral map. The calibration is
+    read from the file or, if it is missing there, from calibration_path.'''
+    import scipy.io as sio
+    mat = dict()
+
+    def read(tag):
+        if not mat:
+            with open_input(path, 'rb') as mat_file:
+                mat.update(sio.loadmat(mat_file))
+        return(mat[tag])
+
+    data3d = fetch(path, lambda path: read('spectra'), cache, 'spectra')
+    dim_x = np.shape(data3d)[0]
+    dim_y = np.shape(data3d)[1]
+    data3d = data3d - background
+    try:
+        calibration = fetch(path,
+                            lambda path: read('wlen_to_px')[0,0],
+                            cache,
+                            'wlen_to_px')
+    except KeyError:
+        calibration = fetch(calibration_path, read_column, cache, 'calibration')
+    return(data3d, calibration, dim_x, dim_y)
+
+
+@timed("load_sweep")
+def load_sweep(path,
+               calibration_wavelength,
+               calibration_parameter,
+               seperator='\t',
+               cache=None):
+    '''loads a .tsv-sweep together with its wavelength and parameter
+    calibration'''
+    data_matrix = fetch(path,
+                        lambda path: read_table(path, seperator),
+                        cache,
+                        'sweep')
+    calibration_wave = fetch(calibration_wavelength, read_column, cache,
+                             'calibration')
+    calibration_param = fetch(calibration_parameter, read_column, cache,
+                              'calibration')
+    return(data_matrix, calibration_wave, calibration_param)
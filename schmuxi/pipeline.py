@@ -0,0 +1,142 @@
+'''Declarative processing pipeline for batches of spectra.
+
+The "pipeline"-section of spec_config.yml lists the processing stages in
+the order they are applied, each with its parameters:
+
+pipeline:
+        - stage: background
+          value: 98
+        - stage: cosmics
+          factor: 5
+          distance: 7
+          cycles: 7
+        - stage: energy
+        - stage: rate
+
+The list is validated once and compiled into a chain of whole-array
+operations on a SpectrumBatch. Stages without effect (e.g. a background of
+0) are dropped while compiling, so they cost nothing per spectrum.'''
+from telemetry import telemetry
+from autofind_paras import scan
+
+
+def parse_bool(value):
+    '''interprets the 'TRUE'/'FALSE' strings of the configuration'''
+    if isinstance(value, bool):
+        return(value)
+    return(str(value).strip().upper() == 'TRUE')
+
+
+def exposure_from_name(spec, default):
+    '''exposure time in seconds as given in the file name, e.g. "-120s-"'''
+    if spec is None:
+        return(default)
+    return(scan(spec).get("exposure", default))
+
+
+def background(batch, value=0):
+    return(batch.subtract_background(value))
+
+
+def cosmics(batch, factor=10, distance=5, cycles=5):
+    return(batch.erase_cosmics(factor, distance, cycles))
+
+
+def energy(batch, jacobian=False):
+    return(batch.to_energy(parse_bool(jacobian)))
+
+
+def normalize(batch):
+    return(batch.normalize())
+
+
+def rate(batch, exposure=-1):
+    exposures = [exposure_from_name(name, exposure) for name in batch.names]
+    return(batch.to_rate(exposures))
+
+
+# stage name -> (function, default parameters)
+stages = {"background": (background, {"value": 0}),
+          "cosmics": (cosmics, {"factor": 10, "distance": 5, "cycles": 5}),
+          "energy": (energy, {"jacobian": False}),
+          "normalize": (normalize, {}),
+          "rate": (rate, {"exposure": -1})}
+
+
+def is_noop(name, parameters):
+    '''stages, that would not change the spectra'''
+    if name == "background":
+        return(parameters["value"] == 0)
+    if name == "cosmics":
+        return(parameters["cycles"] < 1 or parameters["distance"] < 1)
+    return(False)
+
+
+def validate(specification):
+    '''checks the pipeline-specification and returns it as a list of
+    (stage name, parameters), completed by the default parameters'''
+    if not isinstance(specification, list):
+        raise ValueError("The pipeline has to be a list of stages.")
+    validated = []
+    for position, entry in enumerate(specification):
+        if isinstance(entry, str):
+            entry = {"stage": entry}
+        if not isinstance(entry, dict) or "stage" not in entry:
+            raise ValueError("Pipeline entry " + str(position + 1)
+                             + " does not name a stage.")
+        name = entry["stage"]
+        if name not in stages:
+            raise ValueError("Unknown pipeline stage " + repr(name)
+                             + ", use one of " + ", ".join(sorted(stages)))
+        function, defaults = stages[name]
+        parameters = {key: value for key, value in entry.items()
+                      if key != "stage"}
+        unknown = set(parameters) - set(defaults)
+        if unknown:
+            raise ValueError("Unknown parameters for stage " + repr(name)
+                             + ": " + ", ".join(sorted(unknown)))
+        validated.append((name, dict(defaults, **parameters)))
+    return(validated)
+
+
+class Pipeline:
+    '''Compiled chain of processing stages'''
+
+    def __init__(self, specification):
+        self.specification = validate(specification)
+        self.steps = [(name, stages[name][0], parameters)
+                      for name, parameters in self.specification
+                      if not is_noop(name, parameters)]
+        self.names = [name for name, function, parameters in self.steps]
+
+
+    def __contains__(self, name):
+        return(name in self.names)
+
+
+    def run(self, batch, skip=()):
+        '''applies all stages (except the skipped ones) to the batch'''
+        for name, function, parameters in self.steps:
+            if name in skip:
+                continue
+            with telemetry.stage(name):
+                batch = function(batch, **parameters)
+        return(batch)
+
+
+def default_specification(session):
+    '''pipeline equivalent to the boolean switches of spec_paras: background
+    -> cosmics -> energy -> normalize or rate'''
+    specification = [{"stage": "background", "value": session.background},
+                     {"stage": "cosmics",
+                      "factor": session.cosmic_factor,
+                      "distance": session.cosmic_distance,
+                      "cycles": session.cosmic_cycles}]
+    if session.convert_to_energy is True:
+        specification.append({"stage": "energy",
+                              "jacobian": session.jacobian})
+    if session.normalize is True:
+        specification.append({"stage": "normalize"})
+    elif session.convert_to_rate is True:
+        specification.append({"stage": "rate", "exposure": session.exposure})
+    return(specification)
@@ -3,43 +3,102 @@
 #---the target-path.
 #---Included: Replacement of ( , --> . ). Dropping of columns and rows, that are not needed.
 #---It also updates the automatic parameter-section in spec_config.yml (Not Yet):w
+#---The files are cleaned in large byte chunks by several workers. Every file is written
+#---to a temporary file first and renamed when complete, so an interrupted run never
+#---leaves half-written files in the target-path. Compressed source files (.gz, .xz, ...)
+#---are decompressed on the fly and written as plain text.
 
 import os
-from os import chdir
 import yaml
+import tempfile
 from glob import glob
-import re
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from spectrum_parser import clean_bytes
+from compressed import open_input, strip_compression, patterns
 config_source = "spec_config.yml"
 
-with open(config_source, 'r') as configfile:
-    cfg = yaml.load(configfile)
-    
-    if __name__=='__main__':
-        source = cfg["general"]["source_path"]
-        target = cfg["general"]["working_dir"]
-        chdir(source)
-        files_list = glob('*txt')
-
-
-def replace_garbage(source, target, files):
-    """cleans up spectral files"""
-    old_directory = os.getcwd()
-    chdir(source)
-    for a_file in sorted(files):
-        print('opening target ' + a_file)
-        with open(target + a_file,'w') as new_file:
-            print('opening source')
-            with open(source + a_file) as old_file:
-                print('opened source')
-                for line in old_file:
-                    #print('next line')
-                    next_line = line
-                    next_line = next_line.replace(',','.')
-                    next_line = re.sub(r"\t1\t1\t"," ", next_line)
-                    next_line = re.sub(r"\t1\t"," ", next_line)
-                    new_file.write(next_line)
-
-    chdir(old_directory)
+# bytes read at once, the chunks are cut at the last line break
+chunk_size = 4*1024**2
+# batches of at least this size (bytes of the source files) are cleaned by
+# processes, smaller ones by threads, as starting processes takes a while
+process_batch = 64*1024**2
+
+
+def file_mode():
+    """permissions of a newly created file (0666 without the umask)"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return(0o666 & ~umask)
+
+
+def clean_stream(old_file, new_file, chunk_size=chunk_size):
+    """cleans a binary stream chunk by chunk. The replacements never span a
+    line break, so every chunk is cleaned up to its last complete line."""
+    rest = b""
+    while True:
+        chunk = old_file.read(chunk_size)
+        if not chunk:
+            break
+        chunk = rest + chunk
+        end = chunk.rfind(b"\n") + 1
+        rest = chunk[end:]
+        new_file.write(clean_bytes(chunk[:end]))
+    new_file.write(clean_bytes(rest))
+
+
+def clean_file(source, target, a_file, chunk_size=chunk_size, mode=None):
+    """cleans a single spectral file and replaces the target atomically.
+    Returns the name of the cleaned file (without compression suffix)."""
+    mode = file_mode() if mode is None else mode
+    cleaned = strip_compression(a_file)
+    handle, temporary = tempfile.mkstemp(prefix="." + cleaned + ".",
+                                         suffix=".part",
+                                         dir=target)
+    try:
+        with os.fdopen(handle, 'wb') as new_file:
+            with open_input(os.path.join(source, a_file), 'rb') as old_file:
+                clean_stream(old_file, new_file, chunk_size)
+        # mkstemp creates the file readable for its owner only
+        os.chmod(temporary, mode)
+        os.replace(temporary, os.path.join(target, cleaned))
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return(cleaned)
+
+
+def replace_garbage(source, target, files, workers=None, processes=None,
+                    chunk_size=chunk_size):
+    """cleans up spectral files. The files are distributed over a pool of
+    processes (processes=True) or threads (processes=False); workers=1
+    cleans them one after another. Threads only overlap reading, writing
+    and decompressing, the cleaning itself (bytes.translate/replace) holds
+    the GIL and runs in one thread at a time. By default processes are used
+    for batches of at least process_batch bytes. Returns the cleaned
+    files."""
+    files = sorted(files)
+    # the umask is read once, as reading it means setting it
+    clean = partial(clean_file, source, target, chunk_size=chunk_size,
+                    mode=file_mode())
+    if workers == 1 or len(files) < 2:
+        return([clean(a_file) for a_file in files])
+
+    if processes is None:
+        size = sum(os.path.getsize(os.path.join(source, a_file))
+                   for a_file in files)
+        processes = size >= process_batch
+    pool = ProcessPoolExecutor if processes is True else ThreadPoolExecutor
+    with pool(max_workers=workers) as executor:
+        return(list(executor.map(clean, files)))
 
 if __name__ == '__main__':
-    replace_garbage(source, target, files_list)
+    with open(config_source, 'r') as configfile:
+        cfg = yaml.safe_load(configfile)
+    source = cfg["general"]["source_path"]
+    target = cfg["general"]["working_dir"]
+    files_list = [os.path.basename(a_file)
+                  for pattern in patterns('*txt')
+                  for a_file in glob(os.path.join(source, pattern))]
+    cleaned = replace_garbage(source, target, files_list)
+    print('cleaned ' + str(len(cleaned)) + ' files')
@@ -0,0 +1,125 @@
+'''Resampling of many spectra onto a common grid.
+
+Spectra of different acquisitions never share exactly the same axis. To
+compare, average or subtract them, all spectra of a batch are put onto one
+grid. Both methods work on the whole (spectra x pixels) array at once:
+
+linear  linear interpolation of the intensities
+flux    flux conserving rebinning: the integrated intensity of every new bin
+        equals the intensity of the old pixels falling into it
+
+The axes have to be sorted ascending. Shorter spectra may be padded with NaN
+at the end, their lengths are passed separately. Grid points outside of a
+spectrum are NaN.'''
+import numpy as np
+
+methods = ["linear", "flux"]
+
+
+def valid_lengths(axes, lengths=None):
+    '''number of valid pixels of every row'''
+    if lengths is None:
+        lengths = np.full(axes.shape[0], axes.shape[1])
+    return(np.asarray(lengths, dtype=int))
+
+
+def interpolate(axes, values, grid, lengths=None):
+    '''linear interpolation of every row (axes[i], values[i]) at the grid
+    points. All rows are processed in a single searchsorted-call: row i is
+    shifted by i times the total span, so that the flattened axes stay
+    sorted.'''
+    axes = np.atleast_2d(np.asarray(axes, dtype=float))
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    grid = np.asarray(grid, dtype=float)
+    lengths = valid_lengths(axes, lengths)
+    rows, width = axes.shape
+    row = np.arange(rows)[:, np.newaxis]
+
+    # padding repeats the last valid value, which keeps every row sorted
+    column = np.arange(width)[np.newaxis, :]
+    last = np.take_along_axis(axes, (lengths - 1)[:, np.newaxis], axis=1)
+    padded = np.where(column < lengths[:, np.newaxis], axes, last)
+
+    low = min(np.nanmin(padded), grid.min())
+    span = max(np.nanmax(padded), grid.max()) - low + 1
+    flat = (padded - low + row*span).ravel()
+    queries = grid[np.newaxis, :] - low + row*span
+    position = np.searchsorted(flat, queries.ravel()).reshape(queries.shape)
+    position -= row*width
+
+    upper = np.clip(position, 1, np.maximum(lengths - 1, 1)[:, np.newaxis])
+    lower = upper - 1
+    x0 = np.take_along_axis(padded, lower, axis=1)
+    x1 = np.take_along_axis(padded, upper, axis=1)
+    y0 = np.take_along_axis(values, lower, axis=1)
+    y1 = np.take_along_axis(values, upper, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(x1 > x0, (grid - x0)/(x1 - x0), 0.)
+    result = y0 + weight*(y1 - y0)
+
+    first = padded[:, :1]
+    outside = (grid[np.newaxis, :] < first) | (grid[np.newaxis, :] > last)
+    result[outside] = np.nan
+    return(result)
+
+
+def pixel_edges(axes, lengths=None):
+    '''edges of the pixels (midpoints between neighbours, extrapolated at the
+    ends). Returns an array with one column more than axes.'''
+    axes = np.atleast_2d(np.asarray(axes, dtype=float))
+    lengths = valid_lengths(axes, lengths)
+    rows, width = axes.shape
+    edges = np.full((rows, width + 1), np.nan)
+    edges[:, 1:-1] = (axes[:, 1:] + axes[:, :-1])/2
+    edges[:, 0] = axes[:, 0] - (edges[:, 1] - axes[:, 0])
+
+    end = lengths[:, np.newaxis]
+    last = np.take_along_axis(axes, end - 1, axis=1)
+    inner = np.take_along_axis(edges, end - 1, axis=1)
+    np.put_along_axis(edges, end, last + (last - inner), axis=1)
+    return(edges)
+
+
+def rebin(axes, values, grid, lengths=None):
+    '''flux conserving rebinning of every row onto the grid. The cumulative
+    flux is interpolated at the bin edges of the grid and differentiated
+    again.'''
+    axes = np.atleast_2d(np.asarray(axes, dtype=float))
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    lengths = valid_lengths(axes, lengths)
+    edges = pixel_edges(axes, lengths)
+    widths = np.diff(edges, axis=1)
+    flux = np.zeros(edges.shape)
+    column = np.arange(axes.shape[1])[np.newaxis, :]
+    contribution = np.where(column < lengths[:, np.newaxis], values*widths, 0.)
+    flux[:, 1:] = np.cumsum(contribution, axis=1)
+
+    grid_edges = pixel_edges(np.asarray(grid, dtype=float))[0]
+    cumulative = interpolate(edges, flux, grid_edges, lengths + 1)
+    return(np.diff(cumulative, axis=1)/np.diff(grid_edges))
+
+
+def resample(axes, values, grid, method="linear", lengths=None):
+    '''puts every row onto the grid with the given method'''
+    if method == "linear":
+        return(interpolate(axes, values, grid, lengths))
+    if method == "flux":
+        return(rebin(axes, values, grid, lengths))
+    raise ValueError("Unknown resampling method " + repr(method)
+                     + ", use one of " + ", ".join(methods))
+
+
+def common_grid(axes, points, lengths=None, overlap=True):
+    '''equally spaced grid over the range covered by all spectra (overlap)
+    or by any spectrum'''
+    axes = np.atleast_2d(np.asarray(axes, dtype=float))
+    lengths = valid_lengths(axes, lengths)
+    first = axes[:, 0]
+    last = np.take_along_axis(axes, (lengths - 1)[:, np.newaxis], axis=1)[:, 0]
+    if overlap is True:
+        start, end = first.max(), last.min()
+    else:
+        start, end = first.min(), last.max()
+    if not end > start:
+        raise ValueError("The spectra do not overlap.")
+    return(np.linspace(start, end, points))
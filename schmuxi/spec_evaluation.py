@@ -7,28 +7,145 @@ import yaml
 from glob import glob
 from os import chdir
 import os
-import matplotlib.pyplot as plt
 import re
-from autofind_paras import find_parameters
+from autofind_paras import find_parameters, parameter_table
+from cosmics import erase_cosmics
+from spectrum_cache import cache_from_config
+from spectrum_store import store_from_config
+from compressed import base_name, patterns, strip_compression, compressions
+from spectra_index import SpectraIndex
+from spectrum_batch import SpectrumBatch
+from spectrum_parser import parse_spectrum
+from axis_registry import intern_axis
 import logging
-from scipy.optimize import curve_fit
-#from pretreatment import replace_garbage
+from concurrent.futures import ProcessPoolExecutor
+from pretreatment import replace_garbage
+from manifest import Manifest, settings_hash
+from telemetry import telemetry, timed
+from pipeline import Pipeline, default_specification, exposure_from_name, parse_bool
+import argparse
 
 default_config = "spec_config.yml"
 
+# common grid used to compare spectra (see resample.py)
+default_resampling = {"points": 2000, "method": "linear", "overlap": 'FALSE'}
 
 class Experiment:
     '''Represents an experimental session and contains parameters and methods
     to process and publish its results'''
     
-    def pretreatment(self):
-        """pretreatment-method to clean and preformat spectral data."""
-        replace_garbage(self.source, self.working_dir, self.raw_spectra)
-        replace_garbage(self.source, self.working_dir, self.raw_maps)
-        self.spectra = self.list_of_spectra(self.working_dir)
+    def pretreatment(self, force=False, processes=None):
+        """pretreatment-method to clean and preformat spectral data. Only files
+        that changed since the last run are cleaned again, unless forced.
+        processes chooses processes or threads for the cleaning, see
+        pretreatment.replace_garbage."""
+        manifest = Manifest(self.working_dir, force)
+        settings = self.settings_hash("pretreatment")
+        raw_spectra = [os.path.basename(a_file) for a_file in self.raw_spectra]
+        text_files = [self.raw_maps]
+        if self.text_output is True:
+            text_files.append(raw_spectra)
+        for files in text_files:
+            files = [os.path.basename(a_file) for a_file in files]
+            changed = [a_file for a_file in files
+                       if not manifest.is_current(strip_compression(a_file),
+                                                  [self.source + a_file],
+                                                  settings)]
+            replace_garbage(self.source, self.working_dir, changed,
+                            processes=processes)
+            for a_file in changed:
+                manifest.record(strip_compression(a_file),
+                                [self.source + a_file],
+                                settings)
+
+        if self.store is not None:
+            # the raw spectra are parsed once into the binary store
+            stored = {spec: os.path.relpath(
+                                self.store.path(strip_compression(spec)),
+                                self.working_dir)
+                      for spec in raw_spectra}
+            changed = [spec for spec in raw_spectra
+                       if not manifest.is_current(stored[spec],
+                                                  [self.source + spec],
+                                                  settings)]
+            parameters = None
+            if hasattr(self, "config"):
+                parameters = lambda spec: find_parameters(spec, self.config)
+            self.store.ingest(self.source, changed, self.seperator, parameters)
+            for spec in changed:
+                manifest.record(stored[spec], [self.source + spec], settings)
+        manifest.save()
+        self.spectra = self.available_spectra()
         self.maps = self.list_of_maps(self.working_dir)
 
 
+    def settings_hash(self, output):
+        """hash of the settings in effect, the given kind of output depends
+        on: the compiled pipeline and the switches of adjust_spectrum, for
+        png-files also the parameter defaults and the reference. Changing
+        an attribute of the session counts as well as changing the
+        configuration."""
+        config = getattr(self, "config", None) or {}
+        settings = {"seperator": self.seperator}
+        if output == "pretreatment":
+            settings["store"] = config.get("store")
+            return(settings_hash(settings))
+        settings.update({"pipeline": self.pipeline.specification,
+                         "convert_to_energy": self.convert_to_energy,
+                         "exposure": self.exposure})
+        if output == "png":
+            settings["defaults"] = (find_parameters("", config)
+                                    if config else None)
+            settings["reference"] = [config.get("reference"), self.reference]
+        return(settings_hash(settings))
+
+
+    def available_spectra(self):
+        '''spectra of the working directory and of the binary store, always
+        named without compression suffix (spectrum.txt.gz -> spectrum.txt)'''
+        spectra = list(dict.fromkeys(
+                        strip_compression(spec)
+                        for spec in self.list_of_spectra(self.working_dir)))
+        if self.store is not None:
+            spectra = sorted(set(spectra) | set(self.store.names()))
+        return(spectra)
+
+
+    def input_file(self, spec):
+        '''file, a spectrum is loaded from: its entry of the binary store or
+        the cleaned (plain or compressed) text file in the working directory.
+        The spectrum may be named with or without compression suffix.'''
+        name = strip_compression(spec)
+        if self.store is not None and name in self.store:
+            return(self.store.path(name))
+        for candidate in [spec, name] + [name + suffix
+                                         for suffix in compressions]:
+            if os.path.exists(self.working_dir + candidate):
+                return(self.working_dir + candidate)
+        return(self.working_dir + spec)
+
+
+    def spectrum_parameters(self, spec):
+        '''parameters of a spectrum, as recorded in the store or found in its
+        name'''
+        parameters = None
+        if self.store is not None:
+            parameters = self.store.parameters(strip_compression(spec))
+        if parameters is None:
+            parameters = find_parameters(spec, self.config)
+        return(parameters)
+
+
+    def outdated(self, manifest, specs, output, ending):
+        """returns the spectra, whose output files are missing or were
+        created from other inputs or settings"""
+        settings = self.settings_hash(output)
+        return([spec for spec in specs
+                if not manifest.is_current(base_name(spec) + ending,
+                                           [self.input_file(spec)],
+                                           settings)])
+
+
     def auto_config(self, config_source):
         """creates a dictionary of configuration parameters out of given path"""
         config = None
@@ -49,7 +166,7 @@ class Experiment:
     def load_config(self, config_source):
         """loads yml-file and returns it as configuration-dictionary"""
         with open(config_source, 'r') as configfile:
-            config = yaml.load(configfile)
+            config = yaml.safe_load(configfile)
 
         return(config)
 
@@ -70,6 +187,13 @@ class Experiment:
         cosmic_factor = 10,
         cosmic_distance = 5,
         reference = None,
+        workers = 1,
+        cache = None,
+        jacobian = False,
+        resampling = None,
+        pipeline = None,
+        store = None,
+        text_output = True,
         pretreatment = False):
         '''initializies experimental parameters and
         processes configuration.'''
@@ -86,9 +210,10 @@ class Experiment:
                 self.working_dir = config["general"]["working_dir"]
                 self.seperator = config["spec_paras"]["seperator"]
                 self.background = config["spec_paras"]["background"]
-                self.convert_to_energy = True if config["spec_paras"]["convert_to_energy"].upper() == 'TRUE' else False
-                self.convert_to_rate = True if config["spec_paras"]["convert_to_rate"].upper() == 'TRUE' else False
-                self.normalize = True if config["spec_paras"]["normalize"].upper() == 'TRUE' else False
+                self.convert_to_energy = parse_bool(config["spec_paras"]["convert_to_energy"])
+                self.convert_to_rate = parse_bool(config["spec_paras"]["convert_to_rate"])
+                self.normalize = parse_bool(config["spec_paras"]["normalize"])
+                self.jacobian = parse_bool(config["spec_paras"].get("jacobian", 'FALSE'))
                 self.source = config["general"]["source_path"]
                 self.exposure = config["spec_paras"]["exposure"]
 
@@ -97,6 +222,13 @@ class Experiment:
                 self.cosmic_distance = config["auto_paras"]["cosmic_distance"]
 
                 self.reference = config["reference"]["name"]
+                telemetry.configure(config, self.working_dir)
+                self.workers = config["general"].get("workers", 1)
+                self.cache = cache_from_config(config)
+                self.resampling = dict(default_resampling, **config.get("resample", {}))
+                pipeline = config.get("pipeline")
+                self.store = store_from_config(config)
+                self.text_output = parse_bool((config.get("store") or {}).get("text", 'TRUE'))
         else:
                 self.working_dir = working_dir
                 self.seperator = seperator
@@ -104,6 +236,7 @@ class Experiment:
                 self.convert_to_energy = convert_to_energy
                 self.convert_to_rate = convert_to_rate
                 self.normalize = normalize
+                self.jacobian = jacobian
                 self.source = source
                 self.exposure = exposure
 
@@ -112,35 +245,81 @@ class Experiment:
                 self.cosmic_distance = cosmic_distance
 
                 self.reference = reference
+                self.workers = workers
+                self.cache = cache
+                self.resampling = dict(default_resampling, **(resampling or {}))
+                self.store = store
+                self.text_output = text_output
         
+        self.compile_pipeline(pipeline)
+
         self.raw_spectra = self.list_of_spectra(self.source)
         self.raw_maps = self.list_of_maps(self.source)
-        self.spectra = self.list_of_spectra(self.working_dir)
+        self.spectra = self.available_spectra()
         self.maps = self.list_of_maps(self.working_dir)
         
         if pretreatment == True:
             self.pretreatment()
 
 
+    def compile_pipeline(self, specification=None):
+        '''validates and compiles the processing pipeline. Without a
+        specification it follows the switches of the configuration
+        (background -> cosmics -> energy -> normalize/rate) and is compiled
+        again, as soon as one of them is changed.'''
+        self.pipeline_specification = specification
+        self.compiled_pipeline = None
+        return(self.pipeline)
+
+
+    @property
+    def pipeline(self):
+        '''the pipeline compiled for the current specification or switches'''
+        specification = self.pipeline_specification
+        if specification is None:
+            specification = default_specification(self)
+        if (self.compiled_pipeline is None
+                or self.compiled_from != specification):
+            self.compiled_pipeline = Pipeline(specification)
+            self.compiled_from = specification
+        return(self.compiled_pipeline)
+
+
     def change_working_dir(self, place=os.getcwd()):
         '''changes working directory for the expriment'''
         self.working_dir = place
         print("New working-directory is: "+self.working_dir)
 
 
+    @timed("parse")
     def load_file(self, filename):
-        '''reads a csv-file into a pandas.Dataframe'''
-        spectrum = pd.read_csv(filename, self.seperator, header=None)
-
+        '''reads a csv-file into a pandas.Dataframe. Parsed files are kept in
+        the cache, if one is configured. Files of the binary store are
+        memory mapped, as are other .npy-files.'''
+        if filename.endswith('.npy'):
+            if self.store is not None:
+                return(pd.DataFrame(self.store.load(filename)))
+            return(pd.DataFrame(np.load(filename, mmap_mode='r',
+                                        allow_pickle=False)))
+        if self.cache is None:
+            return(pd.DataFrame(self.parse_file(filename)))
+
+        spectrum = pd.DataFrame(self.cache.fetch(filename, self.parse_file))
         return(spectrum)
 
 
+    def parse_file(self, filename):
+        '''parses a two-column file (raw or pretreated) into a numpy array'''
+        return(parse_spectrum(filename, self.seperator))
+
+
     def list_of_spectra(self, source):
-        '''Checks the filenames of txt-files to find Data corresponding to single
-        spectra.'''
+        '''Checks the filenames of txt-files (plain or compressed) to find
+        Data corresponding to single spectra.'''
         old_dir=os.getcwd()
         chdir(source)
-        files_list = glob('*.txt')
+        files_list = [entry for pattern in patterns('*.txt')
+                      for entry in glob(pattern)]
         
         # does not include spectral maps.
         spectra = [entry for entry in files_list if "DC" not in entry]
@@ -151,16 +330,18 @@ class Experiment:
     
 
     def list_of_maps(self, source):
-        '''Checks the filenames of txt-files to find Data corresponding to
-        spectral maps.'''
+        '''Checks the filenames of txt-files (plain or compressed) to find
+        Data corresponding to spectral maps.'''
         old_dir=os.getcwd()
         chdir(source)
-        files_list = glob(source+"\\"+'*.txt')
+        files_list = [entry for pattern in patterns('*.txt')
+                      for entry in glob(source+"\\"+pattern)]
         maps = [entry for entry in files_list if re.match('.*map.*', entry)]
         chdir(old_dir)
         return(maps)
 
 
+    @timed("adjust_background")
     def adjust_background(self, spectrum):
         '''Subtracts background from signal, as specified in the
         configuration'''
@@ -175,23 +356,25 @@ class Experiment:
             return(spectrum)
         
 
+    @timed("cosmic_erase")
     def cosmic_erase(
         self,
         spectrum,
         cosmic_cycles,
         cosmic_distance,
         cosmic_factor):
-        '''Routine for erasing "cosmics", random high intensity peaks'''
-        print("Ich bin schuld")
-        for i in range(cosmic_cycles):
-            if spectrum.iat[spectrum.idxmax()[1], 1] > cosmic_factor * spectrum.iat[spectrum.idxmax()[1]+cosmic_distance, 1]:
-                spectrum.set_value(spectrum.idxmax()[1],
-                                   list(spectrum)[1],
-                                   (spectrum.iat[spectrum.idxmax()[1]-cosmic_distance,1]
-                                  + spectrum.iat[spectrum.idxmax()[1]+cosmic_distance, 1]))
+        '''Routine for erasing "cosmics", random high intensity peaks. See
+        cosmics.py for the rolling median/MAD test.'''
+        intensity = spectrum.columns[-1]
+        cleaned, erased = erase_cosmics(spectrum[intensity].values,
+                                        cosmic_factor,
+                                        cosmic_distance,
+                                        cosmic_cycles)
+        spectrum[intensity] = cleaned
         return(spectrum)
-    
- 
+
+
+    @timed("adjust_scale")
     def adjust_scale(self, 
                      spectrum, 
                      spec=None, 
@@ -205,9 +388,17 @@ class Experiment:
         if self.convert_to_energy is True:
             spectrum.rename(columns={list(spectrum)[0]: 'Energy [eV]'}, inplace=True)
             if overwrite_rescaling == False:
-                spectrum['Energy [eV]'] = 1239.82/spectrum['Energy [eV]']
-                spectrum = spectrum.sort_values("Energy [eV]", axis=0)
-            spectrum.set_index("Energy [eV]", inplace=True)
+                # spectra of the same grating setting share their axis
+                axis = intern_axis(spectrum['Energy [eV]'].values)
+                intensities = spectrum[spectrum.columns[1:]]
+                if self.jacobian is True:
+                    intensities = intensities.mul(axis.jacobian, axis=0)
+                spectrum = pd.DataFrame(intensities.values[axis.order],
+                                        columns=intensities.columns,
+                                        index=pd.Index(axis.sorted_energy,
+                                                       name="Energy [eV]"))
+            else:
+                spectrum.set_index("Energy [eV]", inplace=True)
         else:
             spectrum.rename(columns={list(spectrum)[0]: 'Wavelength [nm]'},
                     inplace=True)
@@ -217,9 +408,7 @@ class Experiment:
             spectrum.rename(columns={list(spectrum)[0]: "Intensity [norm.]"}, inplace=True)
             spectrum = spectrum/spectrum.max()
         elif self.convert_to_rate is True and (spec is not None) and (overwrite_exposure == False): #+ is?
-            if re.match(".*[0-9]+s.*", spec):
-                exposure = float(re.search("[0-9]+s", spec).group()[:-1])
-                print(exposure)
+            exposure = exposure_from_name(spec, exposure)
             spectrum.rename(columns={list(spectrum)[0]: "Counts p.s."}, inplace=True)
             spectrum = spectrum/exposure
         else:
@@ -240,46 +429,80 @@ class Experiment:
                         erase_cosmics=True,
                         y_scale=None):
         '''cleans prepares the given spectral dataframe for plotting in
-        accordance with the configuration-file'''
-        
-        # Erase Background
-        if background == True:
-            spectrum = self.adjust_background(spectrum)
-        
-        # Erase Cosmics (work in progress)
-        if erase_cosmics == True:
-            spectrum = self.cosmic_erase(spectrum,
-                                         self.cosmic_cycles,
-                                         self.cosmic_distance,
-                                         self.cosmic_factor)
-
-        # Convert to Energy
-        spectrum = self.adjust_scale(spectrum,
-                                     spec, 
-                                     self.exposure,
-                                     overwrite_exposure=overwrite_exposure,
-                                     overwrite_rescaling=overwrite_rescaling,
-                                     y_scale=y_scale)
-        
+        accordance with the configuration-file, using the compiled pipeline.
+        Stages can be switched off for spectra, that are already processed.'''
+        skip = set()
+        if background != True:
+            skip.add("background")
+        if erase_cosmics != True:
+            skip.add("cosmics")
+        if overwrite_rescaling != False:
+            skip.add("energy")
+        if overwrite_exposure != False or spec is None:
+            skip.add("rate")
+
+        batch = SpectrumBatch.from_arrays([spec], [spectrum.values[:, :2]])
+        batch = self.pipeline.run(batch, skip)
+        if overwrite_rescaling != False and self.convert_to_energy is True:
+            # the axis is already given in energies
+            batch.x_label = 'Energy [eV]'
+
+        spectrum = batch.frame(0)
+        if y_scale != None:
+            spectrum.columns = [y_scale]
         return(spectrum)
-    
+
 
     def prepare_spectrum(self, spec):
         '''Uses load_file and adjust_spectrum to prepare a dataframe'''
-        spectrum = self.load_file(self.working_dir + spec)
+        spectrum = self.load_file(self.input_file(spec))
         spectrum = self.adjust_spectrum(spectrum, spec)
         return(spectrum)
 
 
+    def find_exposure(self, spec):
+        '''exposure time of a spectrum, taken from its name if possible'''
+        return(exposure_from_name(spec, self.exposure))
+
+
+    def prepare_batch(self, specs):
+        '''Loads a list of spectra into a SpectrumBatch and runs the compiled
+        pipeline on it.'''
+        arrays = []
+        for spec in specs:
+            with telemetry.file(spec):
+                arrays.append(self.load_file(self.input_file(spec)).values)
+        parameters = None
+        if hasattr(self, "config"):
+            with telemetry.stage("find_parameters"):
+                if self.store is None:
+                    parameters = parameter_table(specs, self.config)
+                else:
+                    parameters = pd.DataFrame([self.spectrum_parameters(spec)
+                                               for spec in specs],
+                                              index=specs)
+        batch = SpectrumBatch.from_arrays(specs, arrays, parameters)
+
+        return(self.pipeline.run(batch))
+
+
+    def prepare_spectra(self, specs):
+        '''Prepares a list of spectra like prepare_spectrum, but processes
+        all of them at once. Returns a list of dataframes.'''
+        return(self.prepare_batch(specs).frames())
+
+
+    @timed("plot_layout")
     def plot_spectrum(self, spectrum, parameters=dict(), lines=dict()):
         '''plots a single spectrum into png-file of the same name, according to the experimental configuration.'''
+        import matplotlib.pyplot as plt
         plt.style.use('classic')
         plot_spectrum = spectrum.plot.line(legend=False)
         #plot_spectrum = spectrum.plot.line()
 
         if self.config["reference"]["use"] is ('TRUE' or 'true' or 'True'):
 
-            reference_plot = self.load_file(self.working_dir + self.reference)
+            reference_plot = self.load_file(self.input_file(self.reference))
             reference_plot.columns = ["Energy","Intensity"]
             reference_plot["Energy"] = reference_plot["Energy"] + config["reference"]["offset"]
             reference_plot.set_index(list(reference_plot)[0], inplace=True)
@@ -303,10 +526,11 @@ class Experiment:
         # PLEASE find a more beautiful way.
         count = 0
         for i, j in parameters.items():
+            if j is None: # e.g. no position in the filename
+                continue
             plt.text(spectrum.index[10],spectrum.max()*(0.95-0.05*count), i)
             plt.text(spectrum.index[300],spectrum.max()*(0.95-0.05*count), j)
             count = count + 1
-            print(count)
         #TEST
         for key, value in lines.items():
             plot_spectrum = self.plot_line(
@@ -319,7 +543,6 @@ class Experiment:
 
     def plot_line(self, plot_spectrum, x, y_lim, label='', color='red'):
         '''Plot a vertical line in an existing spectrum'''
-        print("I'm here")
         plot_spectrum.plot([x, x], y_lim)
         plot_spectrum.text(
                             x,
@@ -332,33 +555,59 @@ class Experiment:
         return(plot_spectrum)
 
 
+    @timed("savefig")
     def plot_to_png(self, plot_spectrum, spec):
         '''Saves matplotlib-plot into png-file, given a name. Cuts off the last
         4 characters to eliminate file-endings.'''
+        import matplotlib.pyplot as plt
         old_dir=os.getcwd()
         chdir(self.working_dir)
         fig = plot_spectrum.get_figure()
-        fig.savefig(spec[:-4] + '.png')
-        chdir(old_dir)
+        try:
+            fig.savefig(base_name(spec) + '.png')
+        finally:
+            plt.close(fig)
+            chdir(old_dir)
 
 
+    @timed("save_as_csv")
     def save_as_csv(self, spectrum, spec):
         '''Writes spectrum-dataframe into csv-file, given a name minus the last
         4 characters to eliminate file endings.'''
         old_dir=os.getcwd()
         chdir(self.working_dir)
-        spectrum.to_csv(spec[:-4] + '.csv')
+        spectrum.to_csv(base_name(spec) + '.csv')
         chdir(old_dir)
 
 
+    def prepare_resampled(self, specs, overlap=None):
+        '''prepares a list of spectra and puts them onto a common grid, as
+        configured in the "resample"-section.'''
+        batch = self.prepare_batch(specs)
+        if overlap is None:
+            overlap = str(self.resampling["overlap"]).upper() == 'TRUE'
+        grid = batch.common_grid(self.resampling["points"], overlap)
+        return(batch.resample(grid, self.resampling["method"]))
+
+
     def plot_in_one(self, spectra):
         '''plots a list of spectra in a single figure.'''
-        list_of_spectra = [self.prepare_spectrum(spec) for spec in spectra]
-        joined_spectra = pd.concat(list_of_spectra, axis=1)
-        plot = joined_spectra.plot.line(legend=False)
+        plot = self.prepare_resampled(spectra).plot()
         return(plot)
 
 
+    def average_spectra(self, spectra):
+        '''averages a list of spectra on their common range'''
+        return(self.prepare_resampled(spectra, overlap=True).mean())
+
+
+    def difference_spectrum(self, spec, reference):
+        '''subtracts the reference spectrum from spec on their common range'''
+        batch = self.prepare_resampled([spec, reference], overlap=True)
+        difference = batch.frame(0) - batch.frame(1).values
+        return(difference)
+
+
     def plot_at_once(self):
         '''One-Click-function to publish e1very spectrum in the working
         directory into a single graph (not recommended)'''
@@ -366,20 +615,156 @@ class Experiment:
         self.plot_to_png(plot, "Summary")
 
 
-    def plot_all_spectra(self):
+    def select(self, **filters):
+        '''updates the index of the working directory and returns the
+        spectra matching the filters, e.g. select(temperature=4,
+        power=(10, 100)). See spectra_index.py.'''
+        index = SpectraIndex(self.working_dir)
+        try:
+            index.update(self)
+            return(index.query(**filters))
+        finally:
+            index.close()
+
+
+    def plot_all_spectra(self, workers=None, force=False, specs=None):
         '''"One-Click"-function to publish every spectrum in the
-        working-directory into single images.'''
-        for spec in self.spectra:
-            parameters = find_parameters(spec, self.config)
-            spectrum = self.prepare_spectrum(spec)
-            plot = self.plot_spectrum(
-                    spectrum,
-                    parameters)
-            self.plot_to_png(plot, spec)
+        working-directory (or the given ones) into single images. With more
+        than one worker the spectra are rendered in parallel processes.
+        Spectra, whose image is up to date, are skipped unless forced.
+        Returns a list of (spectrum, error) in the order of self.spectra,
+        error is None for every successfully published spectrum.'''
+        workers = self.workers if workers is None else workers
+        manifest = Manifest(self.working_dir, force)
+        specs = self.spectra if specs is None else specs
+        specs = self.outdated(manifest, specs, "png", '.png')
+        if workers > 1:
+            results = self.plot_all_parallel(workers, specs)
+        else:
+            import matplotlib.pyplot as plt
+            results = []
+            try:
+                spectra = self.prepare_spectra(specs)
+            except Exception:
+                # a bad file spoils the batch, the spectra are prepared one
+                # by one instead, so that only that file fails
+                spectra = [None]*len(specs)
+            for spec, spectrum in zip(specs, spectra):
+                try:
+                    with telemetry.file(spec):
+                        if spectrum is None:
+                            spectrum = self.prepare_spectrum(spec)
+                        parameters = find_parameters(spec, self.config)
+                        plot = self.plot_spectrum(
+                                spectrum,
+                                parameters)
+                        self.plot_to_png(plot, spec)
+                except Exception as error:
+                    plt.close('all')
+                    results.append((spec, repr(error)))
+                else:
+                    results.append((spec, None))
+
+        settings = self.settings_hash("png")
+        for spec, error in results:
+            if error is not None:
+                print("Could not publish " + spec + ": " + error)
+            else:
+                manifest.record(base_name(spec) + '.png',
+                                [self.input_file(spec)],
+                                settings)
+        manifest.save()
+        telemetry.report()
+        return(results)
+
+
+    def export_all_spectra(self, force=False, specs=None):
+        '''writes every spectrum in the working-directory (or the given ones)
+        into a csv-file. Spectra, whose csv-file is up to date, are skipped
+        unless forced.'''
+        manifest = Manifest(self.working_dir, force)
+        specs = self.spectra if specs is None else specs
+        specs = self.outdated(manifest, specs, "csv", '.csv')
+        settings = self.settings_hash("csv")
+        for spec, spectrum in zip(specs, self.prepare_spectra(specs)):
+            self.save_as_csv(spectrum, spec)
+            manifest.record(base_name(spec) + '.csv',
+                            [self.input_file(spec)],
+                            settings)
+        manifest.save()
+        return(specs)
+
+
+    def plot_all_parallel(self, workers, specs=None):
+        '''publishes every given spectrum of the working-directory, spread
+        over a pool of worker processes using the headless Agg-backend.'''
+        specs = self.spectra if specs is None else specs
+        chunksize = max(1, len(specs)//(4*workers))
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(self,
+                                           telemetry.enabled,
+                                           telemetry.memory)) as pool:
+            results = []
+            for spec, error, records in pool.map(render_spectrum,
+                                                 specs,
+                                                 chunksize=chunksize):
+                telemetry.merge(records)
+                results.append((spec, error))
+        return(results)
+
+
+    def report_telemetry(self, path=None):
+        '''prints the timing summary of the session and writes the records as
+        json-lines (see telemetry.py)'''
+        telemetry.report(path)
+
+
+# --- Parallel Rendering ---
+# Every worker process gets its own copy of the experiment once, instead of
+# pickling it for each spectrum.
+
+worker_session = None
+
+
+def init_worker(session, telemetry_enabled=False, telemetry_memory=False):
+    '''initializes a worker process for plot_all_parallel'''
+    global worker_session
+    import matplotlib
+    matplotlib.use('Agg')
+    worker_session = session
+    telemetry.enabled = telemetry_enabled
+    telemetry.memory = telemetry_memory
+    if telemetry_enabled and telemetry_memory:
+        import tracemalloc
+        tracemalloc.start()
+
+
+def render_spectrum(spec):
+    '''find_parameters -> prepare_spectrum -> plot_spectrum -> plot_to_png
+    for a single spectrum in a worker process. Errors are returned instead of
+    raised, so that a single bad file does not abort the batch. The
+    telemetry records are handed back to the main process.'''
+    telemetry.reset()
+    try:
+        with telemetry.file(spec):
+            parameters = find_parameters(spec, worker_session.config)
+            spectrum = worker_session.prepare_spectrum(spec)
+            plot = worker_session.plot_spectrum(spectrum, parameters)
+            worker_session.plot_to_png(plot, spec)
+    except Exception as error:
+        import matplotlib.pyplot as plt
+        plt.close('all')
+        return((spec, repr(error), telemetry.records))
+    return((spec, None, telemetry.records))
 
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--force", action="store_true",
+                        help="process all files, even if they are up to date")
+    arguments = parser.parse_args()
     Session = Experiment()
-    Session.plot_all_spectra()
+    Session.plot_all_spectra(force=arguments.force)
     #Session.plot_all_spectra()
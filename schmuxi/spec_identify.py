@@ -1,12 +1,13 @@
 '''Interactive tool, to identify phonon replicas'''
 import numpy as np
-import matplotlib.pyplot as plt
 import yaml
 from bokeh.plotting import curdoc, gridplot, figure, show, output_file
 from bokeh.layouts import column
 from bokeh.models import Button, TapTool, Slider
 from bokeh.events import Tap
 from spec_evaluation import Experiment
+from telemetry import telemetry, timed
+from decimate import DecimatedLine
 
 with open("spec_config.yml", 'r') as config_file:
     cfg = yaml.load(config_file)
@@ -27,6 +28,8 @@ spec_curve = spec.line(x=[],y=[], line_color="blue")
 replica = spec.multi_line(xs=[], ys=[], line_width=1, line_dash='dashed')
 ds = spec_curve.data_source
 ds2 = replica.data_source
+# the full spectrum stays on the server, the plot gets a decimated version
+line = DecimatedLine(ds)
 
 
 Material = "WS2"
@@ -60,15 +63,21 @@ def adjust_k_phonons(k_energy, phonons):
     return(K_phonons,K_phonons_nested,K_y_values)
 
 
+@timed("display_spectrum")
 def display_spectrum(attr, old, new):
     '''plots spectrum, selected in the slider'''
-    new_data = dict()
     global current_spec
     current_spec = spectra[spec_slider.value]
-    x_axis = current_spec.index.tolist()
-    new_data["x"] = x_axis
-    new_data["y"] = current_spec[list(current_spec)[0]].tolist()
-    ds.data = new_data
+    line.show(current_spec.index.values,
+              current_spec[list(current_spec)[0]].values,
+              spec.x_range.start,
+              spec.x_range.end)
+
+
+@timed("refine_spectrum")
+def refine_spectrum(attr, old, new):
+    '''sends the visible part of the spectrum again, when the user zooms'''
+    line.refine(spec.x_range.start, spec.x_range.end)
 
 k_slider = Slider(start=1.7, end=2.2, value=K_energy, step=0.0001,
                     title="Adjust magic")
@@ -77,6 +86,7 @@ k_fine_slider = Slider(start=(-0.05), end=0.05, value=0, step=0.00001,
 title='finetune magic')
 
 
+@timed("adjust_replica")
 def adjust_replica(attr, old, new):
     '''display of phonon replica adjusted through position of valleys'''
     global K_energy
@@ -87,6 +97,7 @@ def adjust_replica(attr, old, new):
     ds2.data = new_data
 
 
+@timed("publish")
 def publish():
     '''Use spec_evaluation to export the current spectrum as png and txt'''
     plot = Session.plot_spectrum(current_spec) 
@@ -99,9 +110,12 @@ def publish():
 publish_button = Button(label="Fool Referees")
 publish_button.on_click(publish)
 spec_slider.on_change('value', display_spectrum)
+spec.x_range.on_change('start', refine_spectrum)
+spec.x_range.on_change('end', refine_spectrum)
 k_slider.on_change('value', adjust_replica)
 k_fine_slider.on_change('value', adjust_replica)
 panel = gridplot([[spec]])
+curdoc().on_session_destroyed(lambda session_context: telemetry.report())
 curdoc().add_root(column(
                         panel,
                         spec_slider,
@@ -0,0 +1,165 @@
+'''Queryable index of all spectra and maps of an experiment.
+
+The index is a SQLite database in working_dir, that holds one row per file
+with its fingerprint, the parameters found in its name (see autofind_paras),
+the range of its x-axis and some summary statistics of the intensities.
+update() only reads files, that are new or changed since the last update,
+and removes files, that are gone. Queries select spectra by their
+parameters:
+
+index = SpectraIndex(Session.working_dir)
+index.update(Session)
+specs = index.query(temperature=4, excitation=530, power=50)
+specs = index.query(power=(10, 100))    # range, limits included
+Session.plot_all_spectra(specs=specs)'''
+import os
+import sqlite3
+import numpy as np
+from manifest import fingerprint
+from autofind_paras import parameter_names, parameter_table
+
+index_name = ".schmuxi_index.sqlite"
+
+statistics = ["axis_min", "axis_max", "points",
+              "minimum", "maximum", "mean", "total"]
+columns = ["name", "kind", "path", "fingerprint"] + parameter_names + statistics
+
+
+class SpectraIndex:
+    '''SQLite-index of the spectra and maps in a working directory'''
+
+    def __init__(self, working_dir, name=index_name):
+        self.path = os.path.join(working_dir, name)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS spectra ("
+                + "name TEXT PRIMARY KEY, kind TEXT, path TEXT, "
+                + "fingerprint TEXT, "
+                + ", ".join(column + " REAL" for column in parameter_names)
+                + ", axis_min REAL, axis_max REAL, points INTEGER, "
+                + "minimum REAL, maximum REAL, mean REAL, total REAL)")
+        for column in ["kind", "temperature", "excitation", "power"]:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS spectra_"
+                                    + column + " ON spectra (" + column + ")")
+        self.connection.commit()
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def fingerprints(self):
+        '''fingerprints of all indexed files'''
+        return(dict(self.connection.execute(
+                        "SELECT name, fingerprint FROM spectra")))
+
+
+    def update(self, session):
+        '''indexes all new or changed spectra and maps of the session and
+        removes the vanished ones. Returns the updated and removed names.'''
+        files = {spec: ("spectrum", session.input_file(spec))
+                 for spec in session.spectra}
+        for path in session.maps:
+            files[os.path.basename(path)] = ("map", path)
+
+        indexed = self.fingerprints()
+        current = {name: fingerprint(path)
+                   for name, (kind, path) in files.items()}
+        changed = sorted(name for name in files
+                         if indexed.get(name) != current[name])
+        removed = sorted(set(indexed) - set(files))
+
+        parameters = None
+        if hasattr(session, "config"):
+            parameters = parameter_table(changed, session.config)
+        rows = []
+        for name in changed:
+            kind, path = files[name]
+            row = {"name": name, "kind": kind, "path": path,
+                   "fingerprint": current[name]}
+            if parameters is not None:
+                row.update(parameters.loc[name].to_dict())
+            if kind == "spectrum":
+                row.update(summarize(session.load_file(path).values))
+            rows.append([row.get(column) for column in columns])
+
+        self.connection.executemany(
+                "INSERT OR REPLACE INTO spectra (" + ", ".join(columns)
+                + ") VALUES (" + ", ".join("?"*len(columns)) + ")",
+                [[none_if_nan(value) for value in row] for row in rows])
+        self.connection.executemany("DELETE FROM spectra WHERE name = ?",
+                                    [(name,) for name in removed])
+        self.connection.commit()
+        return(changed, removed)
+
+
+    def where(self, filters):
+        '''SQL-condition and its arguments for the given filters'''
+        conditions = []
+        arguments = []
+        for column, value in sorted(filters.items()):
+            if column not in columns:
+                raise ValueError("Unknown column " + repr(column)
+                                 + ", use one of " + ", ".join(columns))
+            if value is None:
+                conditions.append(column + " IS NULL")
+            elif isinstance(value, (tuple, list)):
+                low, high = value
+                if low is not None:
+                    conditions.append(column + " >= ?")
+                    arguments.append(low)
+                if high is not None:
+                    conditions.append(column + " <= ?")
+                    arguments.append(high)
+            else:
+                conditions.append(column + " = ?")
+                arguments.append(value)
+        if not conditions:
+            return("", arguments)
+        return(" WHERE " + " AND ".join(conditions), arguments)
+
+
+    def query(self, kind="spectrum", **filters):
+        '''names of all files matching the filters: column=value or
+        column=(low, high), None for a missing limit'''
+        if kind is not None:
+            filters["kind"] = kind
+        condition, arguments = self.where(filters)
+        return([name for (name,) in self.connection.execute(
+                    "SELECT name FROM spectra" + condition + " ORDER BY name",
+                    arguments)])
+
+
+    def table(self, kind="spectrum", **filters):
+        '''all columns of the matching files as a pandas.DataFrame'''
+        import pandas as pd
+        if kind is not None:
+            filters["kind"] = kind
+        condition, arguments = self.where(filters)
+        return(pd.read_sql_query("SELECT * FROM spectra" + condition
+                                 + " ORDER BY name",
+                                 self.connection,
+                                 params=arguments,
+                                 index_col="name"))
+
+
+def summarize(spectrum):
+    '''axis range and statistics of a two-column spectrum'''
+    axis = spectrum[:, 0]
+    intensity = spectrum[:, 1]
+    return({"axis_min": float(np.nanmin(axis)),
+            "axis_max": float(np.nanmax(axis)),
+            "points": len(axis),
+            "minimum": float(np.nanmin(intensity)),
+            "maximum": float(np.nanmax(intensity)),
+            "mean": float(np.nanmean(intensity)),
+            "total": float(np.nansum(intensity))})
+
+
+def none_if_nan(value):
+    '''SQLite stores missing values as NULL'''
+    if isinstance(value, float) and value != value:
+        return(None)
+    if isinstance(value, np.generic):
+        return(value.item())
+    return(value)
@@ -0,0 +1,168 @@
+'''Array-backed container for many spectra of an experiment.
+
+Instead of one pandas.DataFrame per file, all spectra of a batch share one
+contiguous array for their x-axes and one for their intensities (spectra x
+pixels). Spectra of different length are padded with NaN. All corrections
+run as whole-array operations; the DataFrames used by the plotting methods of
+Experiment are created on demand by frame().'''
+import numpy as np
+import pandas as pd
+from cosmics import erase_cosmics
+from axis_registry import intern_axis
+import resample
+
+
+class SpectrumBatch:
+    '''Spectra with axes and intensities of shape (spectra, pixels) and a
+    parameter table with one row per spectrum'''
+
+    def __init__(self,
+                 names,
+                 axes,
+                 intensities,
+                 lengths=None,
+                 parameters=None,
+                 x_label='Wavelength [nm]',
+                 y_label='Intensity [abs. counts]'):
+        self.names = list(names)
+        self.axes = np.ascontiguousarray(axes, dtype=float)
+        self.intensities = np.ascontiguousarray(intensities, dtype=float)
+        if lengths is None:
+            lengths = np.full(len(self.names), self.axes.shape[1])
+        self.lengths = np.asarray(lengths)
+        self.parameters = parameters
+        self.x_label = x_label
+        self.y_label = y_label
+
+
+    @classmethod
+    def from_arrays(cls, names, arrays, parameters=None):
+        '''creates a batch from a list of two-column arrays
+        (x-axis, intensity)'''
+        lengths = np.array([len(array) for array in arrays], dtype=int)
+        width = lengths.max() if len(arrays) > 0 else 0
+        axes = np.full((len(arrays), width), np.nan)
+        intensities = np.full((len(arrays), width), np.nan)
+        for row, array in enumerate(arrays):
+            axes[row, :len(array)] = array[:, 0]
+            intensities[row, :len(array)] = array[:, 1]
+        return(cls(names, axes, intensities, lengths, parameters))
+
+
+    def __len__(self):
+        return(len(self.names))
+
+
+    def groups(self):
+        '''yields the rows of spectra with the same length'''
+        for length in np.unique(self.lengths):
+            yield(length, np.flatnonzero(self.lengths == length))
+
+
+    def subtract_background(self, background):
+        '''subtracts a constant background from all spectra'''
+        self.intensities -= background
+        return(self)
+
+
+    def erase_cosmics(self, cosmic_factor, cosmic_distance, cosmic_cycles=1,
+                      shot_noise=False):
+        '''erases cosmics of all spectra, see cosmics.py'''
+        for length, rows in self.groups():
+            cleaned, erased = erase_cosmics(self.intensities[rows, :length],
+                                            cosmic_factor,
+                                            cosmic_distance,
+                                            cosmic_cycles,
+                                            shot_noise)
+            self.intensities[rows, :length] = cleaned
+        return(self)
+
+
+    def to_energy(self, jacobian=False):
+        '''converts wavelengths [nm] into energies [eV], sorted ascending.
+        Spectra sharing a wavelength axis are converted together, using the
+        cached energies of the axis registry. With jacobian=True the
+        intensities are converted into intensities per energy.'''
+        for length, rows in self.groups():
+            shared = dict()
+            for row in rows:
+                axis = intern_axis(self.axes[row, :length])
+                shared.setdefault(id(axis), (axis, []))[1].append(row)
+            for axis, members in shared.values():
+                intensities = self.intensities[members, :length]
+                if jacobian is True:
+                    intensities = intensities*axis.jacobian
+                self.intensities[members, :length] = intensities[:, axis.order]
+                self.axes[members, :length] = axis.sorted_energy
+        self.x_label = 'Energy [eV]'
+        return(self)
+
+
+    def to_rate(self, exposures):
+        '''divides every spectrum by its exposure time'''
+        exposures = np.broadcast_to(np.asarray(exposures, dtype=float),
+                                    (len(self),))
+        self.intensities /= exposures[:, np.newaxis]
+        self.y_label = "Counts p.s."
+        return(self)
+
+
+    def normalize(self):
+        '''scales every spectrum to a maximum of 1'''
+        self.intensities /= np.nanmax(self.intensities, axis=1)[:, np.newaxis]
+        self.y_label = "Intensity [norm.]"
+        return(self)
+
+
+    def common_grid(self, points, overlap=True):
+        '''equally spaced grid over the range of all (overlap=True) or any
+        of the spectra'''
+        return(resample.common_grid(self.axes, points, self.lengths, overlap))
+
+
+    def resample(self, grid, method="linear"):
+        '''returns a new batch with all spectra on the given grid, see
+        resample.py for the methods'''
+        grid = np.asarray(grid, dtype=float)
+        intensities = resample.resample(self.axes,
+                                        self.intensities,
+                                        grid,
+                                        method,
+                                        self.lengths)
+        return(SpectrumBatch(self.names,
+                             np.tile(grid, (len(self), 1)),
+                             intensities,
+                             parameters=self.parameters,
+                             x_label=self.x_label,
+                             y_label=self.y_label))
+
+
+    def mean(self):
+        '''average spectrum of a resampled batch as DataFrame'''
+        index = pd.Index(self.axes[0], name=self.x_label)
+        return(pd.DataFrame({self.y_label: np.nanmean(self.intensities, axis=0)},
+                            index=index))
+
+
+    def frame(self, row):
+        '''returns a single spectrum as a DataFrame, indexed by its x-axis'''
+        length = self.lengths[row]
+        index = pd.Index(self.axes[row, :length], name=self.x_label)
+        return(pd.DataFrame({self.y_label: self.intensities[row, :length]},
+                            index=index))
+
+
+    def frames(self):
+        '''returns all spectra as a list of DataFrames'''
+        return([self.frame(row) for row in range(len(self))])
+
+
+    def plot(self, ax=None):
+        '''plots all spectra into a single matplotlib-axis'''
+        import matplotlib.pyplot as plt
+        if ax is None:
+            fig, ax = plt.subplots()
+        ax.plot(self.axes.T, self.intensities.T)
+        ax.set_xlabel(self.x_label)
+        ax.set_ylabel(self.y_label)
+        return(ax)
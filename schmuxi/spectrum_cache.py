@@ -0,0 +1,136 @@
+'''Persistent cache for parsed spectral data.
+
+Parsing text files is by far the slowest part of loading a spectrum, so the
+parsed arrays are kept as .npy-files in a cache directory. An entry is
+identified by the path, size and modification time of the source file (and
+optionally a hash of its content), so edited files are parsed again. The
+least recently used entries are removed, as soon as the cache exceeds its
+maximum size. The size is counted while entries are stored, so the
+directory is only scanned once and whenever entries have to be removed.'''
+import os
+import hashlib
+import numpy as np
+
+default_directory = ".schmuxi_cache"
+default_size = 512 #MB
+# evicting frees some room, so that the next scan is not due at once
+evict_to = 0.9
+
+
+class SpectrumCache:
+    '''Size bounded on-disk LRU-cache of numpy arrays parsed from files'''
+
+    def __init__(self,
+                 cache_dir=default_directory,
+                 max_size=default_size,
+                 hash_content=False):
+        '''max_size is given in MB'''
+        self.cache_dir = cache_dir
+        self.max_size = max_size*1024**2
+        self.hash_content = hash_content
+        # running total of the entry sizes, None until the first scan
+        self.size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+    def key(self, path, tag=''):
+        '''identifier of the cache entry for the given file'''
+        stat = os.stat(path)
+        identity = "|".join([os.path.abspath(path),
+                             str(stat.st_size),
+                             str(stat.st_mtime_ns),
+                             tag])
+        if self.hash_content is True:
+            with open(path, 'rb') as source:
+                identity += "|" + hashlib.sha1(source.read()).hexdigest()
+        return(hashlib.sha1(identity.encode()).hexdigest())
+
+
+    def fetch(self, path, loader, tag=''):
+        '''returns the cached array for path. On a miss loader(path) is called
+        and its result is stored. The tag distinguishes several arrays
+        extracted from the same file.'''
+        entry = os.path.join(self.cache_dir, self.key(path, tag) + '.npy')
+        try:
+            data = np.load(entry, allow_pickle=False)
+        except (IOError, ValueError):
+            pass
+        else:
+            # marks the entry as recently used
+            os.utime(entry)
+            return(data)
+
+        data = np.asarray(loader(path))
+        self.store(entry, data)
+        if self.size > self.max_size:
+            self.evict()
+        return(data)
+
+
+    def store(self, entry, data):
+        '''writes an entry atomically, so that concurrent sessions never read
+        half-written files'''
+        if self.size is None:
+            self.size = sum(size for used, size, path in self.entries())
+        temporary = entry + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'wb') as target:
+            np.save(target, data, allow_pickle=False)
+        try:
+            # a broken entry is replaced
+            self.size -= os.stat(entry).st_size
+        except OSError:
+            pass
+        self.size += os.stat(temporary).st_size
+        os.replace(temporary, entry)
+
+
+    def entries(self):
+        '''returns (last use, size, path) of all entries, oldest first'''
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return(sorted(entries))
+
+
+    def evict(self):
+        '''removes the least recently used entries until the cache fills
+        evict_to of its maximum size'''
+        entries = self.entries()
+        total = sum(size for used, size, path in entries)
+        for used, size, path in entries:
+            if total <= evict_to*self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.size = total
+
+
+    def clear(self):
+        '''removes all entries'''
+        for used, size, path in self.entries():
+            os.remove(path)
+        self.size = 0
+
+
+def cache_from_config(config):
+    '''creates the cache described in the "cache"-section of the
+    configuration. Returns None, if caching is switched off.'''
+    settings = config.get("cache")
+    if not settings or str(settings.get("use", 'FALSE')).upper() != 'TRUE':
+        return(None)
+    cache_dir = os.path.join(config["general"]["working_dir"],
+                             settings.get("directory", default_directory))
+    return(SpectrumCache(
+                cache_dir,
+                settings.get("max_size", default_size),
+                str(settings.get("hash_content", 'FALSE')).upper() == 'TRUE'))
@@ -0,0 +1,59 @@
+'''Fast loader for two-column spectra ("wavelength intensity" per line).
+
+The whole file is read as bytes, decimal commas are translated and the
+LabVIEW filler columns are removed on the whole buffer, before numpy parses
+the numbers directly into a float64 array. Raw files therefore don't have to
+be cleaned by pretreatment.replace_garbage first. Compressed files (.gz, .xz,
+...) are decompressed while reading. Anything that does not look like two
+numeric columns is handed over to pandas, which is only imported then, so
+that pretreatment can use clean_bytes without it.'''
+import io
+import warnings
+import numpy as np
+from compressed import open_input
+
+# same replacements as pretreatment.replace_garbage
+comma_table = bytes.maketrans(b',', b'.')
+
+
+def clean_bytes(data):
+    '''translates decimal commas and removes the LabVIEW filler columns'''
+    data = data.translate(comma_table)
+    return(data.replace(b"\t1\t1\t", b" ").replace(b"\t1\t", b" "))
+
+
+def parse_bytes(data):
+    '''parses cleaned two-column data into an array of shape (lines, 2).
+    Returns None, if the data is not made of two numeric columns.'''
+    first_line = data.lstrip().split(b"\n", 1)[0]
+    if len(first_line.split()) != 2:
+        return(None)
+    with warnings.catch_warnings():
+        # older numpy versions only warn about unparsable data
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            values = np.fromstring(data, dtype=np.float64, sep=" ")
+        except (ValueError, DeprecationWarning):
+            return(None)
+    if values.size == 0 or values.size % 2 != 0:
+        return(None)
+    return(values.reshape(-1, 2))
+
+
+def parse_spectrum(filename, seperator=" "):
+    '''reads a two-column spectrum into a float64 array of shape (lines, 2).
+    Falls back to pandas.read_csv for unusual files or seperators.'''
+    if seperator.strip() != "":
+        import pandas as pd
+        with open_input(filename, 'rb') as spectrum_file:
+            return(pd.read_csv(spectrum_file, sep=seperator, header=None).values)
+
+    with open_input(filename, 'rb') as spectrum_file:
+        data = clean_bytes(spectrum_file.read())
+    spectrum = parse_bytes(data)
+    if spectrum is None:
+        import pandas as pd
+        spectrum = pd.read_csv(io.BytesIO(data),
+                               sep=r"\s+",
+                               header=None).values
+    return(spectrum)
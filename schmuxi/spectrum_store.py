@@ -0,0 +1,126 @@
+'''Binary store of ingested spectra.
+
+Instead of writing cleaned text files into working_dir and parsing them again
+for every evaluation, the raw source files can be parsed once and kept as
+.npy-files (one per spectrum) together with the parameters found in their
+names. Later loads are memory maps of those files, which costs next to
+nothing. The store lives in a directory of working_dir:
+
+.schmuxi_store/
+    spectrum-120s-532nm.txt.npy     (lines, 2) array of float64 or float32
+    parameters.json                 spectrum -> parameters of find_parameters'''
+import os
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from spectrum_parser import parse_spectrum
+from compressed import strip_compression
+
+default_directory = ".schmuxi_store"
+parameters_name = "parameters.json"
+dtypes = ["float64", "float32"]
+
+
+class SpectrumStore:
+    '''Directory of memory mappable spectra and their parameter records'''
+
+    def __init__(self, directory=default_directory, dtype="float64"):
+        if dtype not in dtypes:
+            raise ValueError("Unknown dtype " + repr(dtype)
+                             + ", use one of " + ", ".join(dtypes))
+        self.directory = directory
+        self.dtype = dtype
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(os.path.join(self.directory, parameters_name)) as records:
+                self.records = json.load(records)
+        except (IOError, ValueError):
+            self.records = dict()
+
+
+    def path(self, spec):
+        '''file of the given spectrum'''
+        return(os.path.join(self.directory, spec + '.npy'))
+
+
+    def __contains__(self, spec):
+        return(os.path.exists(self.path(spec)))
+
+
+    def names(self):
+        '''all spectra in the store'''
+        return(sorted(name[:-4] for name in os.listdir(self.directory)
+                      if name.endswith('.npy')))
+
+
+    def load(self, path):
+        '''memory map of a stored spectrum, given by its spectrum name or
+        the path of its file'''
+        if not path.endswith('.npy'):
+            path = self.path(path)
+        return(np.load(path, mmap_mode='r', allow_pickle=False))
+
+
+    def parameters(self, spec):
+        '''parameters recorded for the spectrum, None if unknown'''
+        return(self.records.get(spec))
+
+
+    def write(self, spec, spectrum, parameters=None):
+        '''stores a spectrum atomically, so that concurrent sessions never
+        read half-written files'''
+        entry = self.path(spec)
+        temporary = entry + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'wb') as target:
+            np.save(target,
+                    np.ascontiguousarray(spectrum, dtype=self.dtype),
+                    allow_pickle=False)
+        os.replace(temporary, entry)
+        if parameters is not None:
+            self.records[spec] = parameters
+
+
+    def save(self):
+        '''writes the parameter records atomically'''
+        path = os.path.join(self.directory, parameters_name)
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as records:
+            json.dump(self.records, records, indent=1, sort_keys=True)
+        os.replace(temporary, path)
+
+
+    def ingest(self, source, files, seperator=" ", parameters=None,
+               workers=None):
+        '''parses the raw files of the source directory once and stores
+        them. parameters(spec) returns the record kept for each spectrum.
+        The files are parsed by a pool of threads, compressed files are
+        stored under their name without compression suffix. Returns the
+        stored spectra.'''
+        def ingest_file(a_file):
+            spec = strip_compression(a_file)
+            self.write(spec, parse_spectrum(os.path.join(source, a_file),
+                                            seperator))
+            return(spec)
+
+        files = sorted(files)
+        if workers == 1 or len(files) < 2:
+            stored = [ingest_file(spec) for spec in files]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                stored = list(executor.map(ingest_file, files))
+        if parameters is not None:
+            for spec in stored:
+                self.records[spec] = parameters(spec)
+        self.save()
+        return(stored)
+
+
+def store_from_config(config):
+    '''creates the store described in the "store"-section of the
+    configuration. Returns None, if ingesting is switched off.'''
+    settings = config.get("store")
+    if not settings or str(settings.get("use", 'FALSE')).upper() != 'TRUE':
+        return(None)
+    directory = os.path.join(config["general"]["working_dir"],
+                             settings.get("directory", default_directory))
+    return(SpectrumStore(directory, settings.get("dtype", "float64")))
@@ -0,0 +1,160 @@
+'''Opt-in timing telemetry for the processing pipeline.
+
+Stages of the pipeline (parsing, background, cosmics, scaling, plotting,
+saving, ...) are wrapped with timed() or telemetry.stage(). When telemetry
+is enabled, every call records its wall time, the file it worked on and,
+if memory tracing is switched on, the peak of memory allocated during the
+stage. The records can be written as json-lines or summarized per stage.
+When telemetry is disabled, the wrappers only cost a single check.'''
+import os
+import json
+import time
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Telemetry:
+    '''Collects the records of all timed stages'''
+
+    def __init__(self, enabled=False, memory=False, output=None):
+        self.enabled = enabled
+        self.memory = memory
+        self.output = output
+        self.records = []
+        self.files = []
+        self.open_stages = []
+
+
+    def configure(self, config, directory=''):
+        '''switches telemetry on or off as given in the "telemetry"-section
+        of the configuration. The output is placed in directory.'''
+        settings = config.get("telemetry") or {}
+        self.enabled = str(settings.get("use", 'FALSE')).upper() == 'TRUE'
+        self.memory = str(settings.get("memory", 'FALSE')).upper() == 'TRUE'
+        self.output = settings.get("output")
+        if self.output is not None:
+            self.output = os.path.join(directory, self.output)
+        if self.enabled and self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+    def memory_peak(self):
+        '''peak of traced memory since the last reset'''
+        current, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        return(current, peak)
+
+
+    @contextmanager
+    def file(self, name):
+        '''all stages inside are recorded for the given file'''
+        self.files.append(name)
+        try:
+            yield
+        finally:
+            self.files.pop()
+
+
+    @contextmanager
+    def stage(self, name, file=None):
+        '''records wall time and memory peak of the enclosed code'''
+        if not self.enabled:
+            yield
+            return
+
+        tracing = self.memory and tracemalloc.is_tracing()
+        entry = {"start": 0, "peak": 0}
+        if tracing:
+            current, peak = self.memory_peak()
+            if self.open_stages:
+                outer = self.open_stages[-1]
+                outer["peak"] = max(outer["peak"], peak)
+            entry = {"start": current, "peak": current}
+        self.open_stages.append(entry)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.open_stages.pop()
+            record = {"stage": name,
+                      "file": file or (self.files[-1] if self.files else None),
+                      "seconds": seconds}
+            if tracing:
+                current, peak = self.memory_peak()
+                entry["peak"] = max(entry["peak"], peak)
+                record["peak_mb"] = (entry["peak"] - entry["start"])/1024**2
+                if self.open_stages:
+                    outer = self.open_stages[-1]
+                    outer["peak"] = max(outer["peak"], entry["peak"])
+            self.records.append(record)
+
+
+    def merge(self, records):
+        '''adds records collected in another process'''
+        self.records.extend(records)
+
+
+    def reset(self):
+        self.records = []
+
+
+    def summary(self):
+        '''table of calls, total and mean time and memory peak per stage'''
+        stages = dict()
+        for record in self.records:
+            stage = stages.setdefault(record["stage"],
+                                      {"calls": 0, "seconds": 0., "peak_mb": 0.})
+            stage["calls"] += 1
+            stage["seconds"] += record["seconds"]
+            stage["peak_mb"] = max(stage["peak_mb"], record.get("peak_mb", 0.))
+
+        lines = ["%-22s %7s %10s %10s %10s" % ("stage", "calls", "total [s]",
+                                              "mean [ms]", "peak [MB]")]
+        for name, stage in sorted(stages.items(),
+                                  key=lambda item: -item[1]["seconds"]):
+            lines.append("%-22s %7d %10.3f %10.2f %10.1f" % (
+                                name,
+                                stage["calls"],
+                                stage["seconds"],
+                                1000*stage["seconds"]/stage["calls"],
+                                stage["peak_mb"]))
+        return("\n".join(lines))
+
+
+    def export(self, path=None):
+        '''appends all records as json-lines to the given or configured
+        file'''
+        path = path or self.output
+        if path is None:
+            return
+        with open(path, 'a') as output:
+            for record in self.records:
+                output.write(json.dumps(record) + "\n")
+
+
+    def report(self, path=None):
+        '''prints the summary, exports the records and starts over'''
+        if not self.enabled:
+            return
+        print(self.summary())
+        self.export(path)
+        self.reset()
+
+
+telemetry = Telemetry()
+
+
+def timed(name):
+    '''decorator recording every call of a function as the given stage'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*arguments, **keywords):
+            if not telemetry.enabled:
+                return(function(*arguments, **keywords))
+            with telemetry.stage(name):
+                return(function(*arguments, **keywords))
+        return(wrapper)
+    return(decorator)
@@ -10,4 +10,5 @@ setup(name='schmuxi',
         packages=find_packages(),
         install_requires=['numpy','scipy','pandas','pyyaml'],
         include_package_data=True,
+        entry_points={'console_scripts': ['schmuxi=schmuxi.cli:main']},
         zip_safe=False)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules of schmuxi import each other by their plain names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "schmuxi"))
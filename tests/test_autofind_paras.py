@@ -0,0 +1,19 @@
+import pytest
+from autofind_paras import scan
+from pipeline import exposure_from_name
+
+
+@pytest.mark.parametrize("spec, exposure", [("WS2-3x10s-4K.txt", 10),
+                                            ("WS2-2x60s-50uW.txt", 60),
+                                            ("sample_x5s.txt", 5)])
+def test_accumulations_keep_their_exposure(spec, exposure):
+    assert scan(spec)["exposure"] == exposure
+    assert "x" not in scan(spec)
+    assert exposure_from_name(spec, -1) == exposure
+
+
+def test_position():
+    found = scan("WS2-120s-x41329y08629.txt")
+    assert (found["x"], found["y"], found["exposure"]) == (41329, 8629, 120)
+    found = scan("WSe2-200s-4K-xm03081ym22400_1.txt")
+    assert (found["x"], found["y"]) == (-3081, -22400)
@@ -0,0 +1,11 @@
+import os
+import cli
+
+schmuxi_dir = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "schmuxi")
+
+
+def test_params_reads_the_configuration(capsys):
+    cli.main(["--config", os.path.join(schmuxi_dir, "spec_config.yml"),
+              "params", "WS2-3x10s-4K.txt"])
+    assert "'exposure': 10.0" in capsys.readouterr().out
@@ -0,0 +1,42 @@
+import os
+import shutil
+import pytest
+from spec_evaluation import Experiment
+
+spectra_dir = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "schmuxi", "test-spectra")
+
+
+@pytest.fixture
+def session(tmp_path):
+    for name in sorted(os.listdir(spectra_dir))[:2]:
+        shutil.copy(os.path.join(spectra_dir, name), str(tmp_path))
+    directory = str(tmp_path) + os.sep
+    session = Experiment(auto_config=False, source=directory,
+                         working_dir=directory)
+    # as loaded from a configuration file, whose sections stay unchanged
+    session.config = {"general": {"excitation": 530, "bandwidth": 10,
+                                  "temperature": 4, "power": 50,
+                                  "repetition": 78},
+                      "spec_paras": {"exposure": 1}}
+    return(session)
+
+
+def test_unchanged_settings_are_skipped(session):
+    assert len(session.export_all_spectra()) == 2
+    assert session.export_all_spectra() == []
+
+
+@pytest.mark.parametrize("name, value", [("cosmic_factor", 7),
+                                         ("convert_to_energy", False),
+                                         ("background", 50)])
+def test_changed_settings_export_again(session, name, value):
+    session.export_all_spectra()
+    setattr(session, name, value)
+    assert len(session.export_all_spectra()) == 2
+
+
+def test_png_depends_on_parameter_defaults(session):
+    before = session.settings_hash("png")
+    session.config["general"]["temperature"] = 300
+    assert session.settings_hash("png") != before